@@ -1,43 +1,101 @@
 import logging
+import os
 import re
 import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
 from pathlib import Path
+from queue import Queue
+from typing import Annotated
 
 import typer
 
 import gsrb.cli.record
 from gsrb.utils.app import get_version
-from gsrb.utils.logging import config_logger
+from gsrb.utils.logging import config_logger, flush_logger, log_in_memory
 
 logger = logging.getLogger("gsrb.cli.batch_record")
 
+script_pattern = re.compile(r"\d\d\.py$")
+
+
+def run_record(
+    script_path: Path,
+    id: str,
+    pretest: str | None,
+    generate: bool,
+    devices: "Queue[str]",
+) -> None:
+    """从空闲设备队列中取出一台设备进行录制，结束后归还设备
+
+    录制在独立进程中执行，避免 `record` 中 exec 的脚本共享全局状态
+
+    Args:
+        script_path (Path): 脚本目录
+        id (str): 脚本编号
+        pretest (str | None): pretest 脚本内容
+        generate (bool): 是否生成断言
+        devices (Queue[str]): 空闲设备队列
+    """
+    device = devices.get()
+    # 工作进程会被复用，每次录制只保留本次的调试日志
+    log_in_memory.clear()
+    try:
+        gsrb.cli.record.record_with_pretest(
+            script_path, id, pretest, generate=generate, device=device
+        )
+    except SystemExit:
+        logger.error(f"record {script_path.name} {id} on {device} failed")
+    finally:
+        flush_logger()
+        if generate:
+            # 生成断言需要请求 openai，间隔只阻塞当前设备
+            time.sleep(60)
+        devices.put(device)
+
 
 def batch_record(
     script_paths: list[Path],
     generate: bool = False,
-    device: str = "emulator-5554",
+    device: Annotated[list[str], typer.Option()] = ["emulator-5554"],
+    parallel: int = 1,
+    refresh: bool = False,
 ) -> None:
     config_logger()
+    if refresh:
+        get_version.cache_clear()
+    jobs: list[tuple[Path, str, str | None]] = []
     for script_path in script_paths:
         package = script_path.name
-        version = get_version(device, package)
-        if version is None:
-            logger.error(f"cannot get version of {package}, please check install state")
-            exit(-1)
-        logger.info(f"the version of {package} is {version}")
-        for script in script_path.iterdir():
-            if re.match(r"\d\d\.py", script.name):
-                logger.info(f"record {script.name}")
-
-                gsrb.cli.record.record(
-                    script_path,
-                    script.name.split(".")[0],
-                    generate=generate,
-                    device=device,
+        for d in device:
+            version = get_version(d, package)
+            if version is None:
+                logger.error(
+                    f"cannot get version of {package} on {d}, "
+                    "please check install state"
                 )
+                exit(-1)
+            logger.info(f"the version of {package} on {d} is {version}")
+        # 同一目录下的脚本共享 pretest
+        pretest = gsrb.cli.record.read_pretest(script_path)
+        with os.scandir(script_path) as it:
+            for entry in it:
+                if script_pattern.match(entry.name):
+                    jobs.append((script_path, entry.name.split(".")[0], pretest))
 
-                if generate:
-                    time.sleep(60)
+    with Manager() as manager, ProcessPoolExecutor(
+        max_workers=max(1, parallel)
+    ) as executor:
+        devices: Queue[str] = manager.Queue()
+        for d in device:
+            devices.put(d)
+        futures = [
+            executor.submit(run_record, script_path, id, pretest, generate, devices)
+            for script_path, id, pretest in jobs
+        ]
+        for (script_path, id, _), future in zip(jobs, futures):
+            future.result()
+            logger.info(f"record {script_path.name} {id} finished")
 
 
 def main() -> None:
@@ -1,7 +1,9 @@
+import asyncio
 import logging
+import os
 import re
-import subprocess
 from pathlib import Path
+from typing import Annotated
 
 import typer
 
@@ -10,34 +12,93 @@ from gsrb.utils.logging import config_logger
 
 logger = logging.getLogger("gsrb.cli.batch_repair")
 
+record_pattern = re.compile(r"\d\d\.zip$")
+generate_record_pattern = re.compile(r"\d\d\.generate\.zip$")
+
+
+async def run_repair(cmd: list[str | Path], devices: "asyncio.Queue[str]") -> int:
+    """从空闲设备队列中取出一台设备执行修复，结束后归还设备
+
+    Args:
+        cmd (list[str | Path]): 不含设备参数的修复命令
+        devices (asyncio.Queue[str]): 空闲设备队列
+
+    Returns:
+        int: 修复进程的返回值
+    """
+    device = await devices.get()
+    try:
+        logger.info(f"repair {cmd[1]} {cmd[2]} on {device}")
+        process = await asyncio.create_subprocess_exec(*cmd, "--device", device)
+        returncode = await process.wait()
+        logger.info(f"repair {cmd[1]} {cmd[2]} returned {returncode}")
+        return returncode
+    finally:
+        devices.put_nowait(device)
+
+
+async def run_repairs(
+    cmds: list[list[str | Path]], device: list[str], parallel: int
+) -> list[int]:
+    """并发执行修复命令
+
+    Args:
+        cmds (list[list[str | Path]]): 不含设备参数的修复命令
+        device (list[str]): 可用设备
+        parallel (int): 最大并发数
+
+    Returns:
+        list[int]: 各修复进程的返回值
+    """
+    semaphore = asyncio.Semaphore(max(1, parallel))
+    devices: asyncio.Queue[str] = asyncio.Queue()
+    for d in device:
+        devices.put_nowait(d)
+
+    async def run(cmd: list[str | Path]) -> int:
+        async with semaphore:
+            return await run_repair(cmd, devices)
+
+    return await asyncio.gather(*(run(cmd) for cmd in cmds))
+
 
 def batch_repair(
     script_paths: list[Path],
     generate: bool = False,
-    device: str = "emulator-5556",
+    device: Annotated[list[str], typer.Option()] = ["emulator-5556"],
+    parallel: int = 1,
+    refresh: bool = False,
 ) -> None:
     config_logger()
+    if refresh:
+        get_version.cache_clear()
+    cmds: list[list[str | Path]] = []
+    pattern = generate_record_pattern if generate else record_pattern
     for script_path in script_paths:
         package = script_path.name
-        version = get_version(device, package)
-        if version is None:
-            logger.error(f"cannot get version of {package}, please check install state")
-            exit(-1)
-        logger.info(f"the version of {package} is {version}")
-        for script in script_path.iterdir():
-            pattern = r"\d\d\.zip" if not generate else r"\d\d\.generate\.zip"
-            if re.match(pattern, script.name):
-                logger.info(f"repair {script.name}")
-                cmd: list[str | Path] = [
-                    "repair",
-                    script_path,
-                    script.name.split(".")[0],
-                    "--device",
-                    device,
-                ]
-                if generate:
-                    cmd.append("--generate")
-                subprocess.run(cmd)
+        for d in device:
+            version = get_version(d, package)
+            if version is None:
+                logger.error(
+                    f"cannot get version of {package} on {d}, "
+                    "please check install state"
+                )
+                exit(-1)
+            logger.info(f"the version of {package} on {d} is {version}")
+        with os.scandir(script_path) as it:
+            for entry in it:
+                if pattern.match(entry.name):
+                    cmd: list[str | Path] = [
+                        "repair",
+                        script_path,
+                        entry.name.split(".")[0],
+                    ]
+                    if generate:
+                        cmd.append("--generate")
+                    cmds.append(cmd)
+
+    # 每台设备同一时刻只执行一个修复，实际并行度不超过设备数
+    asyncio.run(run_repairs(cmds, device, parallel))
 
 
 def main() -> None:
@@ -1,31 +1,70 @@
-import re
+import os
+import pickle
 from pathlib import Path
 from typing import Annotated
 
 import pandas as pd
 import typer
 
+repair_time_prefix = "# repair time: "
+explore_time_prefix = "# explore time: "
+
+
+def read_apk_table(xlsx: Path = Path("data/apk.xlsx")) -> pd.DataFrame:
+    """读取 apk 信息表
+
+    解析 xlsx 较慢，首次读取后在同目录缓存为 pickle。缓存中记录了 xlsx 的修改时间与大小，二者变化时重新生成
+
+    Args:
+        xlsx (Path, optional): apk 信息表路径. Defaults to Path("data/apk.xlsx").
+
+    Returns:
+        pd.DataFrame: final 表中的 package 与 testcase_id 两列
+    """
+    cache = xlsx.with_suffix(".final.pkl")
+    stat = xlsx.stat()
+    key = (stat.st_mtime_ns, stat.st_size)
+    try:
+        with cache.open("rb") as f:
+            cached_key, cached = pickle.load(f)
+        if cached_key == key and isinstance(cached, pd.DataFrame):
+            return cached
+    except Exception:
+        # 缓存损坏或由其他版本的 pandas 写入，重新生成
+        pass
+    df = pd.read_excel(xlsx, sheet_name="final", usecols=["package", "testcase_id"])
+    # 先写入临时文件再替换，中断时不会留下不完整的缓存
+    tmp = cache.with_suffix(f".{os.getpid()}.tmp")
+    with tmp.open("wb") as f:
+        pickle.dump((key, df), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, cache)
+    return df
+
 
 def count(
     directory: Annotated[
         Path, typer.Argument(exists=True, file_okay=False, resolve_path=True)
     ] = Path.cwd()
 ) -> None:
-    df = pd.read_excel("data/apk.xlsx", sheet_name="final")
-    for i, row in df.iterrows():
-        if not isinstance(package := row["package"], str):
+    df = read_apk_table()
+    # 直接遍历列数据，避免 iterrows 为每一行构造 Series
+    for package, testcase_id in zip(df["package"].tolist(), df["testcase_id"].tolist()):
+        if not isinstance(package, str):
             break
 
-        script_name = f"{row['testcase_id']}.repaired.generate.py"
+        script_name = f"{testcase_id}.repaired.generate.py"
         script_path = directory / package / script_name
         repair_time = ""
         explore_time = ""
         if script_path.exists():
-            lines = script_path.read_text("utf-8").split("\n")
-            if (match := re.match("# repair time: (.*)s", lines[0])) is not None:
-                repair_time = match.group(1)
-            if (match := re.match("# explore time: (.*)", lines[1])) is not None:
-                explore_time = match.group(1)
+            # 只需要读取脚本开头的两行
+            with script_path.open("r", encoding="utf-8") as f:
+                first = f.readline().rstrip("\n")
+                second = f.readline().rstrip("\n")
+            if first.startswith(repair_time_prefix) and first.endswith("s"):
+                repair_time = first[len(repair_time_prefix) : -1]
+            if second.startswith(explore_time_prefix):
+                explore_time = second[len(explore_time_prefix) :]
         print(f"{package},{script_name},{repair_time},{explore_time}")
 
 
@@ -1,8 +1,8 @@
 import typer
-from uiautomator2 import connect
 
 from gsrb.match.layout import Layout
 from gsrb.match.predictors import optimize_filter_generator, optimize_key_generator
+from gsrb.utils.app import get_device
 from gsrb.utils.logging import config_logger
 
 
@@ -12,7 +12,7 @@ def main() -> None:
 
 def debug(device: str) -> None:
     config_logger()
-    d = connect(device)
+    d = get_device(device)
     layout = Layout.from_device(d)
     optimize_filter = optimize_filter_generator(layout.non_overlap)
     children = optimize_filter(layout.children)
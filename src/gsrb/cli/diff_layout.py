@@ -1,10 +1,10 @@
 import logging
 
 import typer
-import uiautomator2 as u2
 
 from gsrb.match.draw import draw_match
 from gsrb.match.layout import Layout
+from gsrb.utils.app import get_device
 from gsrb.utils.logging import config_logger
 
 logger = logging.getLogger(__name__)
@@ -12,8 +12,8 @@ logger = logging.getLogger(__name__)
 
 def diff_layout(devices: tuple[str, str] = ("emulator-5554", "emulator-5556")) -> None:
     config_logger()
-    d1 = u2.connect(devices[0])
-    d2 = u2.connect(devices[1])
+    d1 = get_device(devices[0])
+    d2 = get_device(devices[1])
     old = Layout.from_device(d1)
     new = Layout.from_device(d2)
     # from gsrb.match.match import MatchInfo, draw_matches
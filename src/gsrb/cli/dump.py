@@ -1,14 +1,15 @@
 from pathlib import Path
 
 import typer
-import uiautomator2 as u2
+
+from gsrb.utils.app import get_device, screencap
 
 
 def dump(device: str, name: str) -> None:
-    d = u2.connect(device)
+    d = get_device(device)
     print(d.info)
     Path(f"{name}.xml").write_text(d.dump_hierarchy(pretty=True), encoding="utf-8")
-    d.screenshot(filename=f"{name}.png")
+    Path(f"{name}.png").write_bytes(screencap(d))
 
 
 def main() -> None:
@@ -56,7 +56,7 @@ def repair(
         pretest=pretest,
         verbose_output=verbose_output,
     )
-    r.repair()
+    exit(0 if r.repair() else -1)
 
 
 def main() -> None:
@@ -10,15 +10,26 @@ from gsrb.utils.logging import config_logger
 logger = logging.getLogger(__name__)
 
 
-def record(
-    script_path: Annotated[
-        Path, typer.Argument(exists=True, file_okay=False, resolve_path=True)
-    ],
+def record_with_pretest(
+    script_path: Path,
     id: str,
+    pretest: str | None,
     rewrite: Optional[Path] = None,
     generate: bool = False,
     device: str = "emulator-5554",
 ) -> None:
+    """使用已读取的 pretest 脚本录制
+
+    批量录制时同一目录下的脚本共享 pretest，只需读取一次
+
+    Args:
+        script_path (Path): 脚本目录
+        id (str): 脚本编号
+        pretest (str | None): pretest 脚本内容
+        rewrite (Optional[Path], optional): 重写脚本的输出路径. Defaults to None.
+        generate (bool, optional): 是否生成断言. Defaults to False.
+        device (str, optional): 设备. Defaults to "emulator-5554".
+    """
     config_logger()
     input = script_path / f"{id}.py"
     package = script_path.name
@@ -31,16 +42,35 @@ def record(
     except IOError:
         logger.exception("read script failed")
         exit(-1)
+
+    gsrb.record.manager.record(
+        package, script, output, device, pretest, rewrite, generate
+    )
+
+
+def read_pretest(script_path: Path) -> str | None:
+    """读取脚本目录下的 pretest 脚本，不存在时返回 None"""
     try:
-        pretest_path = input.parent / "pretest.py"
+        pretest_path = script_path / "pretest.py"
         pretest = pretest_path.read_text(encoding="utf-8")
         logger.info(f"load pretest from {pretest_path.resolve()}")
+        return pretest
     except IOError:
-        pretest = None
-        pass
+        return None
 
-    gsrb.record.manager.record(
-        package, script, output, device, pretest, rewrite, generate
+
+def record(
+    script_path: Annotated[
+        Path, typer.Argument(exists=True, file_okay=False, resolve_path=True)
+    ],
+    id: str,
+    rewrite: Optional[Path] = None,
+    generate: bool = False,
+    device: str = "emulator-5554",
+) -> None:
+    config_logger()
+    record_with_pretest(
+        script_path, id, read_pretest(script_path), rewrite, generate, device
     )
 
 
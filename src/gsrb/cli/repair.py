@@ -37,7 +37,7 @@ def repair(
         optimize_explore=False,
         remove_assertion=False,
     )
-    r.repair()
+    exit(0 if r.repair() else -1)
 
 
 def main() -> None:
@@ -1,3 +1,4 @@
+import os
 import re
 import zipfile
 from pathlib import Path
@@ -6,6 +7,9 @@ from typing import Annotated, Optional
 
 import typer
 
+record_pattern = re.compile(r"\d\d\.zip$")
+generate_record_pattern = re.compile(r"\d\d\.generate\.zip$")
+
 
 def _show(filename: Path, generate: bool) -> None:
     with zipfile.ZipFile(filename, "r") as zf:
@@ -29,10 +33,11 @@ def show(
         filename = f"{id}.zip" if not generate else f"{id}.generate.zip"
         records.append(record_path / filename)
     else:
-        pattern = r"\d\d\.zip" if not generate else r"\d\d\.generate\.zip"
-        for filepath in record_path.iterdir():
-            if re.match(pattern, filepath.name):
-                records.append(filepath)
+        pattern = generate_record_pattern if generate else record_pattern
+        with os.scandir(record_path) as it:
+            for entry in it:
+                if pattern.match(entry.name):
+                    records.append(Path(entry.path))
 
     for record in records:
         print(record.resolve())
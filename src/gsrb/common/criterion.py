@@ -21,17 +21,12 @@ class Criterion(Enum):
     CLASS = auto()
     TEXT = auto()
 
-    @property
-    def u2_name(self) -> str:
-        match self:
-            case Criterion.ID:
-                return "resourceId"
-            case Criterion.DESC:
-                return "description"
-            case Criterion.CLASS:
-                return "className"
-            case Criterion.TEXT:
-                return "text"
+    _value_: int
+    # 属性名与参数名在类定义后写入各成员，读取时不经过 property 与字典查找
+    attr_name: str
+    """布局文件中对应的属性名"""
+    u2_name: str
+    """u2 定位参数中对应的参数名"""
 
     def __call__(self, node: Element, identifier: str) -> bool:
         """判断给定节点是否与 identifier 匹配
@@ -49,35 +44,53 @@ class Criterion(Enum):
         Returns:
             bool: 返回匹配结果
         """
-
-        match self:
-            case Criterion.ID:
-                return node.get("resource-id") == identifier
-            case Criterion.DESC:
-                return node.get("content-desc") == identifier
-            case Criterion.CLASS:
-                return node.get("class") == identifier
-            case Criterion.TEXT:
-                return node.get("text") == identifier
+        return node.get(self.attr_name) == identifier
 
     @classmethod
     def from_parameter(cls, name: str) -> Criterion | None:
-        match name:
-            case "resourceId":
-                return cls.ID
-            case "description":
-                return cls.DESC
-            case "text":
-                return cls.TEXT
-            case "className":
-                return cls.CLASS
-            case _:
-                return None
+        """根据 u2 定位参数名获取对应的 Criterion
+
+        >>> Criterion.from_parameter("resourceId")
+        ID
+        >>> Criterion.from_parameter("instance") is None
+        True
+
+        Args:
+            name (str): u2 定位参数名
+
+        Returns:
+            Criterion | None: 对应的 Criterion，没有对应时为空
+        """
+        return u2_criteria.get(name)
 
     def __repr__(self) -> str:
         return self.name
 
     def __lt__(self, other: object) -> bool:
         if isinstance(other, Criterion):
-            return self.value < other.value
+            return self._value_ < other._value_
         return NotImplemented
+
+
+attr_names: dict[Criterion, str] = {
+    Criterion.ID: "resource-id",
+    Criterion.DESC: "content-desc",
+    Criterion.CLASS: "class",
+    Criterion.TEXT: "text",
+}
+"""Criterion 到布局属性名的映射"""
+
+u2_names: dict[Criterion, str] = {
+    Criterion.ID: "resourceId",
+    Criterion.DESC: "description",
+    Criterion.CLASS: "className",
+    Criterion.TEXT: "text",
+}
+"""Criterion 到 u2 定位参数名的映射"""
+
+u2_criteria: dict[str, Criterion] = {v: k for k, v in u2_names.items()}
+"""u2 定位参数名到 Criterion 的映射"""
+
+for criterion in Criterion:
+    criterion.attr_name = attr_names[criterion]
+    criterion.u2_name = u2_names[criterion]
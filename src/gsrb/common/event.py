@@ -3,7 +3,7 @@ from __future__ import annotations
 
 import logging
 import time
-from collections.abc import Mapping
+from collections.abc import Callable, Mapping
 from dataclasses import dataclass, field
 from importlib.resources import files
 from string import Template
@@ -17,6 +17,9 @@ from gsrb.common.mixin import JsonMixin
 logger = logging.getLogger(__name__)
 
 PERFORM_INTERVAL = 1
+"""执行事件后等待界面稳定的最长时间"""
+STABLE_POLL_INTERVAL = 0.1
+"""判断界面是否稳定时获取布局的间隔"""
 
 TEMPLATE_U2: Template = Template(
     files("gsrb.common")
@@ -26,7 +29,36 @@ TEMPLATE_U2: Template = Template(
 )
 
 
-@dataclass(frozen=True)
+def wait_for_stable(
+    device: Device,
+    timeout: float = PERFORM_INTERVAL,
+    interval: float = STABLE_POLL_INTERVAL,
+) -> None:
+    """等待设备界面稳定
+
+    连续两次获取的布局相同时认为界面已稳定，最多等待 timeout 秒
+
+    Args:
+        device (Device): 连接的设备
+        timeout (float, optional): 最长等待时间. Defaults to PERFORM_INTERVAL.
+        interval (float, optional): 获取布局的间隔. Defaults to STABLE_POLL_INTERVAL.
+    """
+    deadline = time.monotonic() + timeout
+    last = None
+    while True:
+        time.sleep(interval)
+        try:
+            current = device.dump_hierarchy()
+        except Exception:
+            # 无法获取布局时退化为固定等待
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            return
+        if current == last or time.monotonic() >= deadline:
+            return
+        last = current
+
+
+@dataclass(frozen=True, slots=True)
 class Event(JsonMixin):
     """表示一个具体事件的数据类
 
@@ -42,6 +74,12 @@ class Event(JsonMixin):
     action: Action
     locator: Locator | None = None
     parameter: Mapping[str, object] = field(default_factory=dict)
+    _signature: tuple[object, ...] | None = field(
+        init=False, repr=False, compare=False, default=None
+    )
+    """缓存的 (action, locator, parameter) 元组，用于比较与哈希"""
+    _hash: int | None = field(init=False, repr=False, compare=False, default=None)
+    """缓存的哈希值"""
 
     def perform(self, device: Device) -> bool:
         """在设备上执行当前 event
@@ -58,7 +96,9 @@ class Event(JsonMixin):
             else:
                 ui_object = self.locator.find_in_device(device)
                 self.action.perform(device, ui_object, parameter=self.parameter)
-            time.sleep(PERFORM_INTERVAL)
+            # 断言不改变界面，无需等待
+            if not self.is_assertion():
+                wait_for_stable(device)
         except (AssertionError, ValueError, UiObjectNotFoundError):
             return False
         return True
@@ -108,10 +148,7 @@ class Event(JsonMixin):
         return cls(action, locator, parameter)
 
     def with_parameter(self, param: Mapping[str, object]) -> Event:
-        p: dict[str, object] = dict()
-        p.update(self.parameter)
-        p.update(param)
-        return Event(self.action, self.locator, p)
+        return Event(self.action, self.locator, {**self.parameter, **param})
 
     def generate_u2(self, device_part: str) -> str:
         locator_part = "" if self.locator is None else self.locator.generate_u2()
@@ -125,43 +162,60 @@ class Event(JsonMixin):
             if "repaired" in self.parameter:
                 suffix = f"{suffix}repaired"
 
-        match self.action:
-            case Action.CLICK:
-                return f"{prefix}.click(){suffix}"
-            case Action.LONG_CLICK:
-                return f"{prefix}.long_click(){suffix}"
-            case Action.SET_TEXT:
-                return (
-                    f"{prefix}.set_text(\"{self.parameter.get('text', '')}\"){suffix}"
-                )
-            case Action.EXIST:
-                if "failed" in self.parameter:
-                    return f"# assert {prefix}.exists{suffix}"
-                else:
-                    return f"assert {prefix}.exists{suffix}"
-            case Action.NOT_EXIST:
-                return f"assert not {prefix}.exists{suffix}"
-            case Action.BACK:
-                return f'{prefix}.press("back"){suffix}'
-            case Action.EQUAL:
-                return f"assert {prefix}.info[\"{self.parameter['attr']}\"] == \"{self.parameter['oracle']}\"{suffix}"  # noqa
-            case Action.NOT_EQUAL:
-                return f"assert {prefix}.info[\"{self.parameter['attr']}\"] != \"{self.parameter['oracle']}\"{suffix}"  # noqa
-            case Action.SWIPE:
-                return f"{prefix}.swipe({self.parameter['fx']}, {self.parameter['fy']}, {self.parameter['tx']}, {self.parameter['ty']}){suffix}"  # noqa
+        return u2_emitters[self.action](self, prefix, suffix)
 
     def __repr__(self) -> str:
         return self.to_json()
 
+    @property
+    def signature(self) -> tuple[object, ...]:
+        """由 action, locator 与排序后的 parameter 组成的元组，首次访问时计算"""
+        if self._signature is None:
+            parameter = tuple(sorted(self.parameter.items()))
+            object.__setattr__(
+                self, "_signature", (self.action, self.locator, *parameter)
+            )
+        assert self._signature is not None
+        return self._signature
+
     def __eq__(self, __value: object) -> bool:
+        if self is __value:
+            return True
         if isinstance(__value, Event):
-            return (
-                self.action == __value.action
-                and self.locator == __value.locator
-                and self.parameter == __value.parameter
-            )
+            return self.signature == __value.signature
         return False
 
     def __hash__(self) -> int:
-        parameter = tuple(sorted(self.parameter.items()))
-        return hash((self.action, self.locator, *parameter))
+        if self._hash is None:
+            object.__setattr__(self, "_hash", hash(self.signature))
+        assert self._hash is not None
+        return self._hash
+
+    def __getstate__(self) -> dict[str, object]:
+        # 字符串的哈希值随进程变化，缓存的哈希值不能随对象序列化
+        return {
+            "action": self.action,
+            "locator": self.locator,
+            "parameter": self.parameter,
+        }
+
+    def __setstate__(self, state: Mapping[str, object]) -> None:
+        object.__setattr__(self, "action", state["action"])
+        object.__setattr__(self, "locator", state["locator"])
+        object.__setattr__(self, "parameter", state["parameter"])
+        object.__setattr__(self, "_signature", None)
+        object.__setattr__(self, "_hash", None)
+
+
+u2_emitters: dict[Action, Callable[[Event, str, str], str]] = {
+    Action.CLICK: lambda e, prefix, suffix: f"{prefix}.click(){suffix}",
+    Action.LONG_CLICK: lambda e, prefix, suffix: f"{prefix}.long_click(){suffix}",
+    Action.SET_TEXT: lambda e, prefix, suffix: f"{prefix}.set_text(\"{e.parameter.get('text', '')}\"){suffix}",  # noqa
+    Action.EXIST: lambda e, prefix, suffix: f"{'# ' if 'failed' in e.parameter else ''}assert {prefix}.exists{suffix}",  # noqa
+    Action.NOT_EXIST: lambda e, prefix, suffix: f"assert not {prefix}.exists{suffix}",
+    Action.BACK: lambda e, prefix, suffix: f'{prefix}.press("back"){suffix}',
+    Action.EQUAL: lambda e, prefix, suffix: f"assert {prefix}.info[\"{e.parameter['attr']}\"] == \"{e.parameter['oracle']}\"{suffix}",  # noqa
+    Action.NOT_EQUAL: lambda e, prefix, suffix: f"assert {prefix}.info[\"{e.parameter['attr']}\"] != \"{e.parameter['oracle']}\"{suffix}",  # noqa
+    Action.SWIPE: lambda e, prefix, suffix: f"{prefix}.swipe({e.parameter['fx']}, {e.parameter['fy']}, {e.parameter['tx']}, {e.parameter['ty']}){suffix}",  # noqa
+}
+"""各类事件生成 u2 代码的函数，参数依次为事件、代码前缀与注释后缀"""
@@ -2,8 +2,13 @@
 from __future__ import annotations
 
 import logging
+import sys
+from collections import defaultdict
 from collections.abc import Mapping
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import NamedTuple
+from weakref import WeakKeyDictionary
 from xml.etree.ElementTree import Element
 
 from uiautomator2 import Device, UiObject
@@ -14,7 +19,46 @@ from gsrb.common.mixin import JsonMixin
 logger = logging.getLogger(__name__)
 
 
-@dataclass(frozen=True)
+class LayoutIndex(NamedTuple):
+    """布局树的索引"""
+
+    nodes: list[Element]
+    """按文档顺序排列的全部节点"""
+    postings: dict[Criterion, dict[str, list[Element]]]
+    """每个 Criterion 对应属性值到节点列表的映射，节点按文档顺序排列"""
+
+
+layout_indices: WeakKeyDictionary[Element, LayoutIndex] = WeakKeyDictionary()
+"""布局树根节点到其索引的映射，随布局树一同释放"""
+
+
+def get_layout_index(node: Element) -> LayoutIndex:
+    """获取布局树的索引，首次调用时遍历一次布局树建立索引
+
+    建立索引后不应再修改布局树的属性与结构
+
+    Args:
+        node (Element): 布局树的根节点
+
+    Returns:
+        LayoutIndex: 布局树索引
+    """
+    if (index := layout_indices.get(node)) is not None:
+        return index
+    postings: dict[Criterion, defaultdict[str, list[Element]]] = {
+        c: defaultdict(list) for c in Criterion
+    }
+    nodes = list(node.iter("node"))
+    for n in nodes:
+        for c, posting in postings.items():
+            if (value := n.get(c.attr_name)) is not None:
+                posting[value].append(n)
+    index = LayoutIndex(nodes, {c: dict(p) for c, p in postings.items()})
+    layout_indices[node] = index
+    return index
+
+
+@dataclass(frozen=True, slots=True)
 class Locator(JsonMixin):
     """用于定位控件的数据类
 
@@ -27,6 +71,17 @@ class Locator(JsonMixin):
 
     criteria: Mapping[Criterion, str]
     index: int = 0
+    _hash: int | None = field(init=False, repr=False, compare=False, default=None)
+    """缓存的哈希值"""
+    _kwargs: dict[str, str] | None = field(
+        init=False, repr=False, compare=False, default=None
+    )
+    """缓存的 u2 定位参数"""
+
+    def __post_init__(self) -> None:
+        # 标识符驻留后，与布局中驻留的属性值比较时可以直接比较引用
+        criteria = {k: sys.intern(v) for k, v in self.criteria.items()}
+        object.__setattr__(self, "criteria", criteria)
 
     def find_in_layout(self, node: Element) -> Element | None:
         """在布局树中根据定位符寻找控件
@@ -45,10 +100,18 @@ class Locator(JsonMixin):
         Returns:
             Element | None: 返回找到的控件，或者空
         """
-        matched: list[Element] = []
-        for n in node.iter("node"):
-            if all(k(n, v) for k, v in self.criteria.items()):
-                matched.append(n)
+        index = get_layout_index(node)
+        if len(self.criteria) == 0:
+            matched = index.nodes
+        else:
+            # 从最短的节点列表开始，用其余的 criterion 过滤
+            postings = min(
+                (index.postings[k].get(v, []) for k, v in self.criteria.items()),
+                key=len,
+            )
+            matched = [
+                n for n in postings if all(k(n, v) for k, v in self.criteria.items())
+            ]
         if len(matched) == 0 or self.index >= len(matched):
             return None
 
@@ -71,10 +134,16 @@ class Locator(JsonMixin):
     def to_kwargs(self) -> dict[str, str]:
         """获取用于 u2 定位的参数字典
 
+        结果在首次调用时计算并缓存，调用方不应修改返回的字典
+
         Returns:
             dict[str, str | bool]: 参数字典
         """
-        return {k.u2_name: v for k, v in self.criteria.items()}
+        if self._kwargs is None:
+            kwargs = {k.u2_name: v for k, v in self.criteria.items()}
+            object.__setattr__(self, "_kwargs", kwargs)
+        assert self._kwargs is not None
+        return self._kwargs
 
     def to_dict(self) -> dict[str, object]:
         """将自身序列化为字典
@@ -124,17 +193,15 @@ class Locator(JsonMixin):
         Returns:
             Locator: 定位符
         """
-        for attr, criterion in (
-            ("text", Criterion.TEXT),
-            ("content-desc", Criterion.DESC),
-            ("resource-id", Criterion.ID),
+        get = node.attrib.get
+        for attr, index_attr, criterion in (
+            ("text", "text-index", Criterion.TEXT),
+            ("content-desc", "content-desc-index", Criterion.DESC),
+            ("resource-id", "resource-id-index", Criterion.ID),
         ):
-            if (identifier := node.get(attr, "")) != "":
-                index = int(node.get(f"{attr}-index", "0"))
-                return cls({criterion: identifier}, index)
-        identifier = node.get("class", "")
-        index = int(node.get("class-index", "0"))
-        return cls({Criterion.CLASS: identifier}, index)
+            if (identifier := get(attr, "")) != "":
+                return node_locator(criterion, identifier, get(index_attr, "0"))
+        return node_locator(Criterion.CLASS, get("class", ""), get("class-index", "0"))
 
     def generate_u2(self) -> str:
         temp: list[str] = []
@@ -154,5 +221,35 @@ class Locator(JsonMixin):
         return False
 
     def __hash__(self) -> int:
-        criteria = tuple(sorted(self.criteria.items()))
-        return hash((self.index, *criteria))
+        if self._hash is None:
+            criteria = tuple(sorted(self.criteria.items()))
+            object.__setattr__(self, "_hash", hash((self.index, *criteria)))
+        assert self._hash is not None
+        return self._hash
+
+    def __getstate__(self) -> dict[str, object]:
+        # 字符串的哈希值随进程变化，缓存的哈希值不能随对象序列化
+        return {"criteria": self.criteria, "index": self.index}
+
+    def __setstate__(self, state: Mapping[str, object]) -> None:
+        object.__setattr__(self, "criteria", state["criteria"])
+        object.__setattr__(self, "index", state["index"])
+        object.__setattr__(self, "_hash", None)
+        object.__setattr__(self, "_kwargs", None)
+
+
+@lru_cache(maxsize=4096)
+def node_locator(criterion: Criterion, identifier: str, index: str) -> Locator:
+    """根据节点的单个属性构造定位符
+
+    不同截屏中的同一控件会得到相同的定位符，按属性值缓存并共享同一实例
+
+    Args:
+        criterion (Criterion): 属性对应的 Criterion
+        identifier (str): 属性值
+        index (str): 节点上标注的 index
+
+    Returns:
+        Locator: 定位符
+    """
+    return Locator({criterion: identifier}, int(index))
@@ -16,6 +16,8 @@ T = TypeVar("T", bound=Jsonable)
 
 
 class JsonMixin:
+    __slots__ = ()
+
     def to_json(self: Jsonable) -> str:
         return json.dumps(self.to_dict(), ensure_ascii=False)
 
@@ -1,27 +1,73 @@
 """定义数据类 Step 以及加载操作序列的相关方法"""
 import logging
+import threading
+import weakref
 import zipfile
+from collections.abc import Callable, Iterator, Sequence
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import NamedTuple
 
 from gsrb.common.event import Event
 
 logger = logging.getLogger(__name__)
 
 
-class Ui(NamedTuple):
+class Ui:
     """界面
 
     对当前界面信息的抽象，包括布局信息与截屏信息
+
+    布局与截屏可以传入无参的加载函数，首次访问 x 或 p 时才加载并缓存结果
     """
 
-    x: str = ""
-    p: bytes = bytes()
+    __slots__ = ("_x", "_p")
+
+    def __init__(
+        self,
+        x: str | Callable[[], str] = "",
+        p: bytes | Callable[[], bytes] = bytes(),
+    ) -> None:
+        self._x = x
+        self._p = p
+
+    @property
+    def x(self) -> str:
+        """布局信息"""
+        if callable(self._x):
+            self._x = self._x()
+        return self._x
+
+    @property
+    def p(self) -> bytes:
+        """截屏信息"""
+        if callable(self._p):
+            self._p = self._p()
+        return self._p
 
     def empty(self) -> bool:
         return len(self.x) == 0 and len(self.p) == 0
 
+    def __iter__(self) -> Iterator[str | bytes]:
+        yield self.x
+        yield self.p
+
+    def __eq__(self, __value: object) -> bool:
+        if self is __value:
+            return True
+        if isinstance(__value, Ui):
+            return self.x == __value.x and self.p == __value.p
+        return False
+
+    def __hash__(self) -> int:
+        return hash(self.x)
+
+    def __repr__(self) -> str:
+        x = "..." if callable(self._x) else f"{len(self._x)} chars"
+        p = "..." if callable(self._p) else f"{len(self._p)} bytes"
+        return f"Ui(x={x}, p={p})"
+
 
 @dataclass(frozen=True)
 class Step:
@@ -44,8 +90,96 @@ class Step:
 TestCase = list[Step]
 
 
+def read_text(read: Callable[[str], bytes], name: str) -> str:
+    return read(name).decode("utf-8")
+
+
+events_cache_size = 256
+"""同一进程内缓存解析结果的 record 文件个数"""
+
+
+@lru_cache(maxsize=events_cache_size)
+def cached_events(content: bytes) -> tuple[Event, ...]:
+    lines = content.decode("utf-8").split("\n")
+    return tuple(Event.from_json(x) for x in lines if len(x.strip()) != 0)
+
+
+def parse_events(content: bytes) -> list[Event]:
+    """解析 record 文件中的 Event 序列
+
+    解析结果按内容缓存在内存中，同一进程内相同内容再次加载时不重复解析。Event 不可变，可以在多个操作序列间共享
+
+    Args:
+        content (bytes): record 文件内容
+
+    Returns:
+        list[Event]: Event 序列
+    """
+    return list(cached_events(content))
+
+
+def read_many(path: Path, names: Sequence[str], workers: int = 8) -> list[bytes]:
+    """使用线程池并行读取多个文件
+
+    ZipFile 不是线程安全的，每个工作线程各自打开一个 ZipFile
+
+    Args:
+        path (Path): zip 文件或目录
+        names (Sequence[str]): 文件在其中的相对路径
+        workers (int, optional): 线程数. Defaults to 8.
+
+    Returns:
+        list[bytes]: 文件内容，与 names 一一对应
+    """
+    if path.is_dir():
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda name: (path / name).read_bytes(), names))
+
+    local = threading.local()
+    handles: list[zipfile.ZipFile] = []
+
+    def read(name: str) -> bytes:
+        zf = getattr(local, "zf", None)
+        if zf is None:
+            zf = local.zf = zipfile.ZipFile(path, "r")
+            handles.append(zf)
+        return zf.read(name)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(read, names))
+    finally:
+        for zf in handles:
+            zf.close()
+
+
+class ZipReader:
+    """按文件名读取 zip 文件中的内容
+
+    一个操作序列中延迟加载的界面共享同一个打开的 ZipFile，只解析一次中央目录，读取时加锁
+
+    所有界面都不再引用 ZipReader 时自动关闭文件，也可以调用 close 提前关闭
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.zf = zipfile.ZipFile(path, "r")
+        self.lock = threading.Lock()
+        self.finalizer = weakref.finalize(self, self.zf.close)
+
+    def __call__(self, name: str) -> bytes:
+        with self.lock:
+            return self.zf.read(name)
+
+    def namelist(self) -> list[str]:
+        return self.zf.namelist()
+
+    def close(self) -> None:
+        """关闭 zip 文件，之后不能再读取"""
+        self.finalizer()
+
+
 def load_testcase(
-    path: Path | str, generate: bool = False
+    path: Path | str, generate: bool = False, lazy: bool = True
 ) -> tuple[TestCase, str | None]:
     """从文件系统加载操作序列
 
@@ -53,8 +187,15 @@ def load_testcase(
 
     子目录 ui 存储了界面信息，共 2n 个界面，编号 i 的 event 对应的执行前后界面编号分别为 2i 和 2i + 1
 
+    界面信息默认延迟加载，在首次访问时才从文件系统读取；lazy 为 False 时使用线程池一次性读取
+
     Args:
         path (os.PathLike): 操作序列所在路径
+        generate (bool, optional): 是否加载带断言的操作序列. Defaults to False.
+        lazy (bool, optional): 是否延迟加载界面信息. Defaults to True.
+
+    Raises:
+        FileNotFoundError: 缺少 record 文件或界面信息
 
     Returns:
         tuple[TestCase, str | None]: 操作序列与 pretest 脚本
@@ -62,43 +203,71 @@ def load_testcase(
     if not isinstance(path, Path):
         path = Path(path)
 
+    read: Callable[[str], bytes]
+    exists: Callable[[str], bool]
+    reader: ZipReader | None = None
+    if path.is_dir():
+        root = path
+        read = lambda name: (root / name).read_bytes()  # noqa: E731
+        exists = lambda name: (root / name).is_file()  # noqa: E731
+    else:
+        # zip 文件只打开一次，延迟加载界面信息时直接按文件名读取
+        reader = ZipReader(path)
+        read = reader
+        exists = set(reader.namelist()).__contains__
+
     def load_ui(i: int) -> tuple[Ui, Ui]:
-        lb = (root / "ui" / f"{i * 2}.xml").read_text(encoding="utf-8")
-        sb = (root / "ui" / f"{i * 2}.png").read_bytes()
-        la = (root / "ui" / f"{i * 2 + 1}.xml").read_text(encoding="utf-8")
-        sa = (root / "ui" / f"{i * 2 + 1}.png").read_bytes()
-        return Ui(lb, sb), Ui(la, sa)
+        before = Ui(
+            partial(read_text, read, f"ui/{i * 2}.xml"),
+            partial(read, f"ui/{i * 2}.png"),
+        )
+        after = Ui(
+            partial(read_text, read, f"ui/{i * 2 + 1}.xml"),
+            partial(read, f"ui/{i * 2 + 1}.png"),
+        )
+        return before, after
 
     result: TestCase = []
-    root: Path | zipfile.Path = path
-    zf = None
-    if not path.is_dir():
-        zf = zipfile.ZipFile(path, "r")
-        root = zipfile.Path(zf)
-    pretest = None
-
-    # read pretest script if exists
+    # 加载失败时及时关闭 zip 文件
     try:
-        pretest = (root / "pretest.py").read_text(encoding="utf-8")
-    except Exception:
-        pass
+        pretest = read_text(read, "pretest.py") if exists("pretest.py") else None
 
-    # read event sequence
-    if generate:
-        events_str = (root / "record_with_assertion.txt").read_text(encoding="utf-8")
-    else:
-        events_str = (root / "record.txt").read_text(encoding="utf-8")
-    events = [Event.from_json(x) for x in events_str.split("\n") if len(x.strip()) != 0]
+        record_name = "record_with_assertion.txt" if generate else "record.txt"
+        if not exists(record_name):
+            raise FileNotFoundError(f"{record_name} not found in {path}")
+        events = parse_events(read(record_name))
+
+        n_ui = sum(1 for e in events if not e.parameter.get("generated", False))
+        names = [f"ui/{j}.{ext}" for j in range(n_ui * 2) for ext in ("xml", "png")]
+        # 延迟加载时在首次访问才会读取，在加载时检查界面信息是否完整
+        if missing := [name for name in names if not exists(name)]:
+            raise FileNotFoundError(f"{', '.join(missing)} not found in {path}")
+        uis: list[tuple[Ui, Ui]]
+        if lazy:
+            uis = [load_ui(i) for i in range(n_ui)]
+        else:
+            data = read_many(path, names)
+            uis = [
+                (
+                    Ui(data[i * 4].decode("utf-8"), data[i * 4 + 1]),
+                    Ui(data[i * 4 + 2].decode("utf-8"), data[i * 4 + 3]),
+                )
+                for i in range(n_ui)
+            ]
+    except BaseException:
+        if reader is not None:
+            reader.close()
+        raise
+    if reader is not None and not lazy:
+        # 界面信息已经全部读取，不再需要打开的 zip 文件
+        reader.close()
 
     i = 0
     for event in events:
         if event.parameter.get("generated", False):
             result.append(Step(event))
         else:
-            result.append(Step(event, *load_ui(i)))
+            result.append(Step(event, *uis[i]))
             i += 1
 
-    if zf is not None:
-        zf.close()
-
     return result, pretest
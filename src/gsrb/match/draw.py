@@ -18,9 +18,14 @@ def get_canvas(old: bytes, new: bytes) -> tuple[Image.Image, int]:
     ) as ni:
         width = oi.width + ni.width
         height = max(oi.height, ni.height)
-        image = Image.new("RGB", (width, height))
+        # 画布几乎全部会被截屏覆盖，不做初始化，只填充高度不足时露出的部分
+        image = Image.new("RGB", (width, height), None)
         image.paste(oi, (0, 0))
         image.paste(ni, (oi.width, 0))
+        if oi.height < height:
+            image.paste((0, 0, 0), (0, oi.height, oi.width, height))
+        if ni.height < height:
+            image.paste((0, 0, 0), (oi.width, ni.height, width, height))
         return image, oi.width
 
 
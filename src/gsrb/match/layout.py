@@ -3,88 +3,107 @@ from __future__ import annotations
 
 import io
 import logging
-from collections import Counter, defaultdict
-from collections.abc import Iterable, Mapping
+from collections import defaultdict
+from collections.abc import Iterable, Mapping, Sequence
 from dataclasses import dataclass, field
+from functools import cached_property
 from xml.etree.ElementTree import Element, fromstring
 
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 from uiautomator2 import Device
 
-from gsrb.match.predictors import is_child, is_cover, is_overlap, is_parent
+from gsrb.match.predictors import (
+    cover_matrix,
+    excluded_classes,
+    is_child,
+    is_parent,
+    overlaps,
+    tree_hash,
+)
 from gsrb.match.preprocess import preprocess
-from gsrb.utils.element import coordinates, digest
+from gsrb.utils.app import screencap
+from gsrb.utils.element import bounds_array, coordinates, digest
 
 logger = logging.getLogger(__name__)
 
+attr_keys = ("class", "text", "content-desc", "resource-id", "clickable", "bounds")
+"""Layout.attrs 中缓存的节点属性"""
 
-def get_valid_node(node: Element) -> set[Element]:
+
+def get_valid_node(
+    nodes: Sequence[Element], bbox: np.ndarray | None = None
+) -> set[Element]:
     """获取所有可有效交互的组件
 
     Args:
-        node (Element): 根节点
+        nodes (Sequence[Element]): 布局中所有 node 节点，按先序遍历的顺序
+        bbox (np.ndarray | None, optional): nodes 的坐标数组，为空时重新解析. Defaults to None.
 
     Returns:
         set[Element]: 所有有效节点的集合
     """
+    if bbox is None:
+        bbox = bounds_array(nodes)
     result: set[Element] = set()
-    for n in node.iter("node"):
+    # 结果中的叶节点与可点击叶节点，覆盖判断只需要在这两个子集中进行
+    result_children = np.zeros(len(nodes), dtype=bool)
+    result_clickable = np.zeros(len(nodes), dtype=bool)
+    for i, n in enumerate(nodes):
+        if not is_child(n):
+            result.add(n)
+            continue
+        clickable = n.get("clickable")
         # 选取所有被 n 覆盖的组件并删去
-        if is_child(n) and n.get("clickable") == "true":
-            result -= {x for x in result if is_child(x) and is_cover(n, x)}
-        if is_child(n) and n.get("clickable") == "false":
+        if clickable == "true":
+            covered = result_children & cover_matrix(bbox[i : i + 1], bbox)[0]
+            for j in np.flatnonzero(covered).tolist():
+                result.discard(nodes[j])
+            result_children &= ~covered
+            result_clickable &= ~covered
+        if clickable == "false":
             # 如果当前节点不可点击且有可点击的叶节点覆盖当前节点，不加入该节点
-            if (
-                len(
-                    [
-                        m
-                        for m in result
-                        if is_child(m)
-                        and m.get("clickable") == "true"
-                        and is_cover(m, n)
-                    ]
-                )
-                > 0
-            ):
+            if (result_clickable & cover_matrix(bbox, bbox[i : i + 1])[:, 0]).any():
                 continue
         result.add(n)
+        result_children[i] = True
+        if clickable == "true":
+            result_clickable[i] = True
     return result
 
 
-def get_children(node: Element) -> set[Element]:
+def get_children(
+    nodes: Sequence[Element], bbox: np.ndarray | None = None
+) -> set[Element]:
     """获取当前界面的叶节点
 
     叶节点除了要满足 `is_child` 还要满足是有效节点
 
     Args:
-        node (Element): 根节点
+        nodes (Sequence[Element]): 布局中所有 node 节点，按先序遍历的顺序
+        bbox (np.ndarray | None, optional): nodes 的坐标数组. Defaults to None.
 
     Returns:
         set[Element]: 叶节点集合
     """
-    return {x for x in get_valid_node(node) if is_child(x)}
+    return {x for x in get_valid_node(nodes, bbox) if is_child(x)}
 
 
-def get_parents(node: Element) -> set[Element]:
+def get_parents(nodes: Iterable[Element]) -> set[Element]:
     """获取当前界面的非叶节点
 
     Args:
-        node (Element): 根节点
+        nodes (Iterable[Element]): 布局中所有 node 节点
 
     Returns:
         set[Element]: 非叶节点集合
     """
-    return {x for x in node.iter("node") if is_parent(x)}
+    return {x for x in nodes if is_parent(x)}
 
 
 def compress_parents(parents: set[Element]) -> set[Element]:
-    need_remove = set()
-    for a in parents:
-        for b in parents:
-            if a != b and len(b) == 1 and b[0] == a:
-                need_remove.add(b)
-
-    return parents - need_remove
+    """移除只有一个子节点且该子节点同为父节点的节点"""
+    return {b for b in parents if not (len(b) == 1 and b[0] in parents)}
 
 
 def get_list_items(children: Iterable[Element]) -> list[list[Element]]:
@@ -109,7 +128,10 @@ def get_list_items(children: Iterable[Element]) -> list[list[Element]]:
 
 
 def get_non_overlap(
-    children: Iterable[Element], cp: Mapping[Element, Element]
+    children: Iterable[Element],
+    cp: Mapping[Element, Element],
+    bbox: np.ndarray,
+    node_idx: Mapping[Element, int],
 ) -> dict[Element, Element]:
     """寻找一组子节点的最大无重叠父节点
 
@@ -118,6 +140,8 @@ def get_non_overlap(
     Args:
         children (list[Element]): 子节点集合
         cp (dict[Element, Element]): 子节点与其父节点的映射
+        bbox (np.ndarray): 布局中所有节点的坐标数组
+        node_idx (Mapping[Element, int]): 节点在坐标数组中的下标
 
     Returns:
         dict[Element, Element]: 子节点与其最大无重叠父节点的映射
@@ -126,18 +150,30 @@ def get_non_overlap(
     # 初始化父节点为自身
     for child in children:
         result[child] = child
+    keys = list(result.keys())
+    # 各子节点当前父节点的坐标，父节点上移时原地更新
+    boxes = bbox[[node_idx[k] for k in keys]]
+    # 已经到达根部的子节点不会再变化，不再参与后续的轮次
+    active = list(range(len(keys)))
 
     update: bool = True
     while update:
         update = False
-        for child in result.keys():
-            current_parent = result[child]
-            next_parent = cp.get(current_parent)
-            if next_parent and next_parent.tag != "hierarchy":
-                other_parents = [result[k] for k in result.keys() if k != child]
-                if all(not is_overlap(next_parent, parent) for parent in other_parents):
-                    result[child] = next_parent
-                    update = True
+        still_active: list[int] = []
+        for i in active:
+            child = keys[i]
+            next_parent = cp.get(result[child])
+            if not next_parent or next_parent.tag == "hierarchy":
+                continue
+            still_active.append(i)
+            next_box = bbox[node_idx[next_parent]]
+            overlap = overlaps(next_box, boxes)
+            overlap[i] = False
+            if not overlap.any():
+                result[child] = next_parent
+                boxes[i] = next_box
+                update = True
+        active = still_active
     return result
 
 
@@ -152,7 +188,6 @@ def get_non_unique(children: Iterable[Element]) -> set[Element]:
     Returns:
         set[Element]: 不唯一的组件
     """
-    result: set[Element] = set()
 
     def node_hash(node: Element) -> tuple[str, str, str]:
         return (
@@ -161,13 +196,11 @@ def get_non_unique(children: Iterable[Element]) -> set[Element]:
             node.get("text", ""),
         )
 
-    counter = Counter([node_hash(child) for child in children])
-
-    for k, v in counter.items():
-        if v > 1:
-            result.update(child for child in children if node_hash(child) == k)
+    groups: defaultdict[tuple[str, str, str], list[Element]] = defaultdict(list)
+    for child in children:
+        groups[node_hash(child)].append(child)
 
-    return result
+    return {child for group in groups.values() if len(group) > 1 for child in group}
 
 
 def get_unique_children(children: Iterable[Element]) -> set[Element]:
@@ -192,6 +225,16 @@ class Layout:
     xml: str
     png: bytes
     root: Element = field(init=False)
+    nodes: list[Element] = field(init=False)
+    """预处理后布局中所有 node 节点，按先序遍历的顺序"""
+    bbox: np.ndarray = field(init=False)
+    """形状为 (N, 4) 的坐标数组，每行依次为 nodes 中对应节点的 x0 y0 x1 y1"""
+    node_idx: dict[Element, int] = field(init=False, default_factory=dict)
+    """节点在 nodes 与 bbox 中的下标"""
+    attrs: dict[str, np.ndarray] = field(init=False, default_factory=dict)
+    """按 nodes 顺序缓存的节点属性，缺省为空字符串"""
+    excluded: np.ndarray = field(init=False)
+    """nodes 中各节点是否属于 excluded_classes"""
     children: set[Element] = field(init=False)
     """参与匹配的子节点集"""
     parents: set[Element] = field(init=False)
@@ -200,6 +243,10 @@ class Layout:
     """子节点到自身父节点的映射"""
     non_overlap: dict[Element, Element] = field(init=False, default_factory=dict)
     """列表项与自身最大无重叠父节点的映射"""
+    non_overlap_inv: dict[Element, list[Element]] = field(
+        init=False, default_factory=dict
+    )
+    """最大无重叠父节点到其下列表项的映射"""
     non_unique: set[Element] = field(init=False, default_factory=set)
     """非唯一的列表项集合"""
     unique_children: set[Element] = field(init=False, default_factory=set)
@@ -209,6 +256,11 @@ class Layout:
         n = "\n"
         return f"```{n.join(map(digest, (c for c in self.children if not c.get('resource-id', '').startswith('com.google.android'))))}```"  # noqa
 
+    @cached_property
+    def tree_hash(self) -> int:
+        """预处理后布局树的结构哈希，用于快速判断两个布局是否相同"""
+        return tree_hash(self.root)
+
     @property
     def ui(self) -> tuple[str, bytes]:
         return self.xml, self.png
@@ -225,15 +277,30 @@ class Layout:
         """
         self.root = fromstring(self.xml)
         preprocess(self.root)
-        self.children = get_children(self.root)
-        self.parents = get_parents(self.root)
+        # 只遍历一次布局树，后续处理复用节点列表
+        self.nodes = list(self.root.iter("node"))
+        self.bbox = bounds_array(self.nodes)
+        self.node_idx = {n: i for i, n in enumerate(self.nodes)}
+        for key in attr_keys:
+            values = np.empty(len(self.nodes), dtype=object)
+            values[:] = [n.get(key, "") for n in self.nodes]
+            self.attrs[key] = values
+        self.excluded = np.array(
+            [c in excluded_classes for c in self.attrs["class"]], dtype=bool
+        )
+        self.children = get_children(self.nodes, self.bbox)
+        self.parents = get_parents(self.nodes)
         self.parents = compress_parents(self.parents)
-        self.cp = {c: p for p in self.root.iter("node") for c in p}
+        self.cp = {c: p for p in self.nodes for c in p}
         self.unique_children = get_unique_children(self.children)
 
         for children in get_list_items(self.children):
-            self.non_overlap.update(get_non_overlap(children, self.cp))
+            self.non_overlap.update(
+                get_non_overlap(children, self.cp, self.bbox, self.node_idx)
+            )
             self.non_unique.update(get_non_unique(children))
+        for k, v in self.non_overlap.items():
+            self.non_overlap_inv.setdefault(v, []).append(k)
 
     def draw(self, nodes: Iterable[Element], with_index: bool = False) -> None:
         """将节点轮廓画在截屏上，用于 debug 或展示
@@ -281,6 +348,4 @@ class Layout:
             Layout: 基于当前布局产生的 Layout 对象
         """
         xml = device.dump_hierarchy()
-        png = device.screenshot(format="raw")
-        assert isinstance(png, bytes)
-        return Layout(xml, png)
+        return Layout(xml, screencap(device))
@@ -1,8 +1,10 @@
+import heapq
 import io
 import logging
+from collections import defaultdict
 from dataclasses import dataclass, field
-from functools import reduce
-from typing import Callable, Iterable
+from functools import partial
+from typing import Callable, Iterable, Sequence
 from xml.etree.ElementTree import Element
 
 import cv2
@@ -10,7 +12,7 @@ import numpy as np
 from PIL import Image
 
 from gsrb.match.layout import Layout
-from gsrb.match.predictors import attr_equal, is_in_bound, is_like, is_match
+from gsrb.match.predictors import assign_points, attr_equal, is_like, is_match
 from gsrb.utils.element import digest
 
 logger = logging.getLogger(__name__)
@@ -18,6 +20,174 @@ logger = logging.getLogger(__name__)
 threshold = 0.8
 
 
+def has_cuda() -> bool:
+    """OpenCV 是否可以使用 CUDA 设备"""
+    try:
+        return (
+            hasattr(cv2.cuda, "DescriptorMatcher_createBFMatcher")
+            and cv2.cuda.getCudaEnabledDeviceCount() > 0
+        )
+    except cv2.error:
+        return False
+
+
+use_cuda = has_cuda()
+"""是否在 GPU 上进行特征点匹配，在导入时检测一次"""
+
+flann_index_params: dict[str, bool | int | float | str] = {"algorithm": 1, "trees": 5}
+"""FLANN 索引参数，algorithm=1 即 KD 树"""
+flann_search_params: dict[str, bool | int | float | str] = {"checks": 50}
+"""FLANN 搜索参数"""
+
+
+feature = "sift"
+"""提取特征点的算法，可选 sift 与 orb，orb 使用二进制描述子，速度更快但特征点更少"""
+
+ratios = {"sift": 0.8, "orb": 0.75}
+"""各算法在比值检验中使用的阈值"""
+
+image_scale = 0.5
+"""提取特征点前截屏的缩放比例，特征点坐标会还原到原始截屏上"""
+reduced_flags = {
+    1: cv2.IMREAD_GRAYSCALE,
+    0.5: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    0.25: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    0.125: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+"""解码时可以直接缩小的比例及对应的 imdecode 参数"""
+
+
+def decode_gray(png: bytes) -> np.ndarray:
+    """将截屏解码为按 image_scale 缩放的灰度图
+
+    Args:
+        png (bytes): 截屏数据
+
+    Returns:
+        np.ndarray: 灰度图
+
+    Raises:
+        ValueError: 截屏数据无法解码
+    """
+    buf = np.frombuffer(png, dtype=np.uint8)
+    scaled = image_scale in reduced_flags
+    flag = reduced_flags[image_scale] if scaled else cv2.IMREAD_GRAYSCALE
+    img = cv2.imdecode(buf, flag)
+    if img is None:
+        raise ValueError(f"cannot decode screenshot of {len(png)} bytes")
+    if scaled:
+        return img
+    return cv2.resize(
+        img, None, fx=image_scale, fy=image_scale, interpolation=cv2.INTER_AREA
+    )
+
+
+def create_detector() -> cv2.Feature2D:
+    """根据 feature 创建特征点检测器"""
+    if feature == "orb":
+        return cv2.ORB.create(nfeatures=2000, scaleFactor=1.2, nlevels=8)
+    return cv2.SIFT.create()
+
+
+def cuda_knn_match(
+    desc_old: np.ndarray, desc_new: np.ndarray, norm: int
+) -> Sequence[Sequence[cv2.DMatch]]:
+    """在 GPU 上对两组描述子进行 k = 2 的暴力匹配
+
+    Args:
+        desc_old (np.ndarray): 旧版本截屏的描述子
+        desc_new (np.ndarray): 新版本截屏的描述子
+        norm (int): 距离类型
+
+    Returns:
+        Sequence[Sequence[cv2.DMatch]]: 每个旧版本描述子的两个最近邻
+    """
+    # opencv 的类型存根不包含 CUDA 模块
+    cuda = cv2.cuda
+    matcher = cuda.DescriptorMatcher_createBFMatcher(norm)  # type: ignore[attr-defined]
+    gpu_old = cv2.cuda_GpuMat()  # type: ignore[attr-defined]
+    gpu_new = cv2.cuda_GpuMat()  # type: ignore[attr-defined]
+    gpu_old.upload(desc_old)
+    gpu_new.upload(desc_new)
+    matches: Sequence[Sequence[cv2.DMatch]] = matcher.knnMatch(gpu_old, gpu_new, 2)
+    return matches
+
+
+def knn_match(
+    desc_old: np.ndarray | None, desc_new: np.ndarray | None
+) -> Sequence[Sequence[cv2.DMatch]]:
+    """对两组描述子进行 k = 2 的近邻匹配
+
+    空白或纯色截屏没有特征点，描述子为 None；任一侧不足两个描述子时直接返回空结果
+
+    有可用的 CUDA 设备时在 GPU 上暴力匹配。否则 SIFT 描述子在 CPU 上使用 FLANN 的 KD 树近似匹配，
+    ORB 的二进制描述子使用汉明距离暴力匹配
+
+    Args:
+        desc_old (np.ndarray | None): 旧版本截屏的描述子
+        desc_new (np.ndarray | None): 新版本截屏的描述子
+
+    Returns:
+        Sequence[Sequence[cv2.DMatch]]: 每个旧版本描述子的两个最近邻
+    """
+    if desc_old is None or desc_new is None or len(desc_old) < 2 or len(desc_new) < 2:
+        return []
+    binary = desc_old.dtype == np.uint8
+    norm = cv2.NORM_HAMMING if binary else cv2.NORM_L2
+    if use_cuda:
+        return cuda_knn_match(desc_old, desc_new, norm)
+    if binary:
+        return cv2.BFMatcher(norm).knnMatch(desc_old, desc_new, 2)
+    matcher = cv2.FlannBasedMatcher(flann_index_params, flann_search_params)
+    return matcher.knnMatch(
+        np.ascontiguousarray(desc_old, dtype=np.float32),
+        np.ascontiguousarray(desc_new, dtype=np.float32),
+        2,
+    )
+
+
+def count_shared_points(
+    old: tuple[np.ndarray, np.ndarray],
+    new: tuple[np.ndarray, np.ndarray],
+    n_old: int,
+    n_new: int,
+) -> np.ndarray:
+    """统计每对新旧组件共同包含的匹配点数
+
+    每个点只落在少数几个嵌套的组件内，只需枚举同一个点所在的新旧组件对
+
+    Args:
+        old (tuple[np.ndarray, np.ndarray]): 匹配点在旧组件中的 assign_points 结果
+        new (tuple[np.ndarray, np.ndarray]): 匹配点在新组件中的 assign_points 结果
+        n_old (int): 旧组件数
+        n_new (int): 新组件数
+
+    Returns:
+        np.ndarray: 形状为 (n_old, n_new) 的计数数组
+    """
+    (old_ptr, old_cols), (new_ptr, new_cols) = old, new
+    old_len, new_len = np.diff(old_ptr), np.diff(new_ptr)
+    total = old_len * new_len
+    point = np.repeat(np.arange(len(total)), total)
+    offset = np.arange(total.sum()) - np.repeat(np.cumsum(total) - total, total)
+    i = old_cols[old_ptr[point] + offset // new_len[point]]
+    j = new_cols[new_ptr[point] + offset % new_len[point]]
+    counts: np.ndarray = np.bincount(i * n_new + j, minlength=n_old * n_new)
+    return counts.reshape(n_old, n_new)
+
+
+def log_matched(kind: str, old: Element, new: Element) -> None:
+    """记录一对匹配的组件，未开启 debug 日志时不计算 digest
+
+    Args:
+        kind (str): 匹配类型
+        old (Element): 旧版本中的组件
+        new (Element): 新版本中的组件
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"{kind} {digest(old)} {digest(new)}")
+
+
 @dataclass
 class Result:
     """代表匹配结果的数据类"""
@@ -47,33 +217,46 @@ class MatchInfo:
     matched_points: dict[cv2.KeyPoint, cv2.KeyPoint] = field(
         init=False, default_factory=dict
     )
+    old_points: np.ndarray = field(
+        init=False, default_factory=lambda: np.empty((0, 2), dtype=np.float32)
+    )
+    """matched_points 中旧版本特征点的坐标，形状为 (K, 2)"""
+    new_points: np.ndarray = field(
+        init=False, default_factory=lambda: np.empty((0, 2), dtype=np.float32)
+    )
+    """与 old_points 逐行对应的新版本特征点坐标"""
 
     def __post_init__(self) -> None:
         if len(self.old.png) == 0 or len(self.new.png) == 0:
             return
 
-        img_old = cv2.imdecode(
-            np.frombuffer(self.old.png, dtype=np.uint8), cv2.IMREAD_GRAYSCALE
-        )
-        img_new = cv2.imdecode(
-            np.frombuffer(self.new.png, dtype=np.uint8), cv2.IMREAD_GRAYSCALE
-        )
-        sift = cv2.SIFT.create()
-        kp_old, desc_old = sift.detectAndCompute(
-            img_old, np.full(img_old.shape, 255, np.uint8)
-        )
-        kp_new, desc_new = sift.detectAndCompute(
-            img_new, np.full(img_new.shape, 255, np.uint8)
-        )
+        img_old = decode_gray(self.old.png)
+        img_new = decode_gray(self.new.png)
+        detector = create_detector()
+        kp_old, desc_old = detector.detectAndCompute(img_old, None)
+        kp_new, desc_new = detector.detectAndCompute(img_new, None)
 
-        matcher = cv2.DescriptorMatcher.create(cv2.DescriptorMatcher_BRUTEFORCE)
-        matches = matcher.knnMatch(desc_old, desc_new, 2)
+        matches = knn_match(desc_old, desc_new)
+        if image_scale != 1:
+            # 将特征点坐标还原到原始截屏上
+            for kp in (*kp_old, *kp_new):
+                x, y = kp.pt
+                kp.pt = (x / image_scale, y / image_scale)
 
+        ratio = ratios[feature]
         for match_pair in matches:
             m, n = match_pair[0], match_pair[1]
-            if m.distance < n.distance * 0.8:
+            if m.distance < n.distance * ratio:
                 self.matched_points[kp_old[m.queryIdx]] = kp_new[m.trainIdx]
 
+        if len(self.matched_points) > 0:
+            self.old_points = np.array(
+                [kp.pt for kp in self.matched_points.keys()], dtype=np.float32
+            )
+            self.new_points = np.array(
+                [kp.pt for kp in self.matched_points.values()], dtype=np.float32
+            )
+
 
 def draw_matches(
     png_old: bytes, png_new: bytes, matches: dict[cv2.KeyPoint, cv2.KeyPoint]
@@ -128,26 +311,48 @@ def match_sure(
     # 不能在这一步匹配不唯一的列表项
     old_candidates = info.old.children - info.old.non_unique
     new_candidates = info.new.children - info.new.non_unique
-    update: bool = True
-    while update:
-        update = False
-        for old_child in (n for n in old_candidates if n not in info.matched):
-            candidates: list[Element] = []
-            for new_child in (n for n in new_candidates if n not in info.matched):
-                if predictor(old_child, new_child):
-                    candidates.append(new_child)
-
-            if len(candidates) == 1:
-                update = True
-                # 唯一候选
-                candidate = candidates[0]
-                result.matched[old_child] = candidate
-                logger.debug(f"matched {digest(old_child)} {digest(candidate)}")
-                info.matched.update([old_child, candidate])
-                match_sibling(old_child, candidate, info, result)
-
-
-def match_sibling(old: Element, new: Element, info: MatchInfo, result: Result) -> None:
+    old_list = list(old_candidates)
+
+    # 只构造一次候选集，之后每次匹配只更新引用了新匹配组件的候选集
+    candidates: list[set[Element]] = []
+    # 新版本组件到将其作为候选的旧版本组件下标的映射
+    referrers: defaultdict[Element, list[int]] = defaultdict(list)
+    for i, old_child in enumerate(old_list):
+        candidates.append(set())
+        if old_child in info.matched:
+            continue
+        for new_child in (n for n in new_candidates if n not in info.matched):
+            if predictor(old_child, new_child):
+                candidates[i].add(new_child)
+                referrers[new_child].append(i)
+
+    # 按 (轮次, 下标) 出队，与逐轮扫描所有旧版本组件的匹配顺序一致
+    queue = [(0, i) for i, c in enumerate(candidates) if len(c) == 1]
+    while queue:
+        turn, i = heapq.heappop(queue)
+        old_child = old_list[i]
+        if old_child in info.matched or len(candidates[i]) != 1:
+            continue
+
+        # 唯一候选
+        candidate = next(iter(candidates[i]))
+        result.matched[old_child] = candidate
+        log_matched("matched", old_child, candidate)
+        info.matched.update([old_child, candidate])
+        newly_matched = [old_child, candidate]
+        for pair in match_sibling(old_child, candidate, info, result):
+            newly_matched.extend(pair)
+
+        for matched in newly_matched:
+            for j in referrers.pop(matched, []):
+                candidates[j].discard(matched)
+                if len(candidates[j]) == 1 and old_list[j] not in info.matched:
+                    heapq.heappush(queue, (turn if j > i else turn + 1, j))
+
+
+def match_sibling(
+    old: Element, new: Element, info: MatchInfo, result: Result
+) -> list[tuple[Element, Element]]:
     """匹配列表项的兄弟节点
 
     兄弟节点：即拥有同一个最大不重叠父节点的列表项
@@ -157,21 +362,21 @@ def match_sibling(old: Element, new: Element, info: MatchInfo, result: Result) -
         new (Element): 新版本组件
         info (MatchInfo): 匹配信息
         result (Result): 匹配结果
+
+    Returns:
+        list[tuple[Element, Element]]: 本次新匹配的兄弟节点对
     """
+    sibling_matched: list[tuple[Element, Element]] = []
     if old not in info.old.non_overlap or new not in info.new.non_overlap:
         # 双方都是列表项才可继续匹配
-        return
+        return sibling_matched
     logger.debug("start match siblings")
     old_parent = info.old.non_overlap[old]
     new_parent = info.new.non_overlap[new]
     info.matched_parents[old_parent] = new_parent
 
-    old_siblings = [
-        k for k, v in info.old.non_overlap.items() if v == old_parent and k != old
-    ]
-    new_siblings = [
-        k for k, v in info.new.non_overlap.items() if v == new_parent and k != new
-    ]
+    old_siblings = [k for k in info.old.non_overlap_inv[old_parent] if k is not old]
+    new_siblings = [k for k in info.new.non_overlap_inv[new_parent] if k is not new]
 
     for old_sibling in (n for n in old_siblings if n not in info.matched):
         candidates: list[Element] = []
@@ -185,8 +390,10 @@ def match_sibling(old: Element, new: Element, info: MatchInfo, result: Result) -
         if len(candidates) == 1:
             candidate = candidates[0]
             result.matched[old_sibling] = candidate
-            logger.debug(f"sibling matched {digest(old_sibling)} {digest(candidate)}")
+            log_matched("sibling matched", old_sibling, candidate)
             info.matched.update([old_sibling, candidate])
+            sibling_matched.append((old_sibling, candidate))
+    return sibling_matched
 
 
 def match_possible(
@@ -250,15 +457,12 @@ def match_possible(
                 )
             ):
                 result.matched[old_child] = candidate
-                logger.debug(
-                    f"unique possible matched "
-                    f"{digest(old_child)} {digest(candidate)}"
-                )
+                log_matched("unique possible matched", old_child, candidate)
                 info.matched.update([old_child, candidate])
             else:
                 result.possible[old_child] = candidates
                 for candidate in candidates:
-                    logger.debug(f"possible {digest(old_child)} {digest(candidate)}")
+                    log_matched("possible", old_child, candidate)
 
 
 def match_parents(
@@ -282,7 +486,7 @@ def match_parents(
 
         if len(candidates) == 1:
             candidate = candidates[0]
-            logger.debug(f"parents matched {digest(old_parent)} {digest(candidate)}")
+            log_matched("parents matched", old_parent, candidate)
             info.matched_parents[old_parent] = candidate
             matched_parents.update([old_parent, candidate])
 
@@ -312,9 +516,7 @@ def optimize_match(
 
             if len(candidates) == 1:
                 candidate = candidates[0]
-                logger.debug(
-                    f"optimize matched {digest(old_child)} {digest(candidate)}"
-                )
+                log_matched("optimize matched", old_child, candidate)
                 result.matched[old_child] = candidate
                 info.matched.update([old_child, candidate])
 
@@ -332,55 +534,53 @@ def unique_match(info: MatchInfo, result: Result) -> None:
         if len(candidates) == 1:
             candidate = candidates[0]
             result.matched[old_child] = candidate
-            logger.debug(f"unique matched {digest(old_child)} {digest(candidate)}")
+            log_matched("unique matched", old_child, candidate)
             info.matched.update([old_child, candidate])
 
 
 def sift_match(info: MatchInfo, result: Result) -> None:
     logger.debug("start sift match")
     update: bool = True
-    exclude_set = {
-        "android.widget.CheckBox",
-        "android.widget.EditText",
-        "android.widget.Switch",
-    }
+    # 预先统计每个旧组件内的特征点数，以及其中匹配点落在每个新组件内的数量
+    old_children = list(info.old.children)
+    new_children = list(info.new.children)
+    old_idx = [info.old.node_idx[n] for n in old_children]
+    new_idx = [info.new.node_idx[n] for n in new_children]
+    in_old = assign_points(info.old_points, info.old.bbox[old_idx])
+    in_new = assign_points(info.new_points, info.new.bbox[new_idx])
+    old_counts = np.bincount(in_old[1], minlength=len(old_children))
+    match_counts = count_shared_points(
+        in_old, in_new, len(old_children), len(new_children)
+    )
+    # 一次性计算所有组件对的匹配点比例，只保留无文本且不属于排除类型的组件
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratios = match_counts / old_counts[:, None]
+    old_valid = (
+        (info.old.attrs["text"][old_idx] == "")
+        & ~info.old.excluded[old_idx]
+        & (old_counts >= 1)
+    )
+    new_valid = (info.new.attrs["text"][new_idx] == "") & ~info.new.excluded[new_idx]
+    passed = (ratios >= 0.6) & new_valid
+    # 这一步只会新增本轮匹配的组件，未匹配的新组件在循环中同步更新
+    new_free = np.array([n not in info.matched for n in new_children], dtype=bool)
+
     while update:
         update = False
-        for old_child in (
-            n
-            for n in info.old.children
-            if n not in info.matched
-            and n.get("text", "") == ""
-            and n.get("class") not in exclude_set
-        ):
-            old_points = [
-                point
-                for point in info.matched_points.keys()
-                if is_in_bound(point, old_child)
-            ]
-            if len(old_points) < 1:
+        for i in np.flatnonzero(old_valid).tolist():
+            old_child = old_children[i]
+            if old_child in info.matched:
                 continue
-            old_matches = [info.matched_points[point] for point in old_points]
-            candidates: list[Element] = list()
-            for new_child in (
-                n
-                for n in info.new.children
-                if n not in info.matched and n.get("text", "") == ""
-                # and n.get("class", "") == old_child.get("class", "")
-                and n.get("class") not in exclude_set
-            ):
-                new_match_num = len(
-                    [point for point in old_matches if is_in_bound(point, new_child)]
-                )
-                if (new_match_num / len(old_points)) >= 0.6:
-                    candidates.append(new_child)
+            candidates = np.flatnonzero(passed[i] & new_free)
 
             if len(candidates) == 1:
                 update = True
-                candidate = candidates[0]
-                logger.debug(f"sift matched {digest(old_child)} {digest(candidate)}")
+                j = int(candidates[0])
+                candidate = new_children[j]
+                log_matched("sift matched", old_child, candidate)
                 result.matched[old_child] = candidate
                 info.matched.update([old_child, candidate])
+                new_free[j] = False
 
 
 def set_not_match(info: MatchInfo, result: Result) -> None:
@@ -390,9 +590,7 @@ def set_not_match(info: MatchInfo, result: Result) -> None:
         info (MatchInfo): 匹配信息
         result (Result): 匹配结果
     """
-    new_possible: set[Element] = reduce(
-        lambda x, y: x | y, result.possible.values(), set()
-    )
+    new_possible: set[Element] = set().union(*result.possible.values())
     result.old_not_matched = {
         x
         for x in info.old.children
@@ -435,17 +633,20 @@ def match_layout(old: Layout, new: Layout) -> Result:
     result = Result()
     info = MatchInfo(old, new)
 
-    match_sure(info, result, lambda x, y: is_match(x, y))  # 根据属性确定匹配，优先级最高
-    match_sure(info, result, lambda x, y: is_like(x, y))  # 根据属性模糊匹配
+    loose_match = partial(is_match, strict=False)
+    loose_like = partial(is_like, strict=False)
+
+    match_sure(info, result, is_match)  # 根据属性确定匹配，优先级最高
+    match_sure(info, result, is_like)  # 根据属性模糊匹配
 
     sift_match(info, result)
-    match_parents(info, lambda x, y: is_match(x, y, strict=False))
-    optimize_match(info, result, lambda x, y: is_like(x, y, strict=False))
+    match_parents(info, loose_match)
+    optimize_match(info, result, loose_like)
     unique_match(info, result)
     # draw_matches(info.old.png, info.new.png, info.matched_points)
     # 至此确定匹配结束
 
-    match_possible(info, result, lambda x, y: is_match(x, y, strict=False))
+    match_possible(info, result, loose_match)
 
     set_not_match(info, result)
     set_match_score(result)
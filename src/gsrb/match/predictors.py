@@ -1,21 +1,106 @@
 import logging
 import re
-from collections import Counter, defaultdict
+from collections import Counter
 from collections.abc import Iterable, Mapping
-from typing import Callable, NamedTuple
-from xml.etree.ElementTree import Element, canonicalize, tostring
+from functools import lru_cache
+from typing import Callable
+from xml.etree.ElementTree import Element
 
 import cv2
-from Levenshtein import ratio
+import numpy as np
+from rapidfuzz.distance import Indel
 
-from gsrb.utils.element import coordinates
+from gsrb.utils.element import Coordinate, coordinates
 
 logger = logging.getLogger(__name__)
 
 id_pattern = r"^(?:[A-Za-z][A-Za-z\d_]*)(?:\.[A-Za-z][A-Za-z\d_]*)*:id/(?P<content>.*)$"
+id_regex = re.compile(id_pattern)
+space_regex = re.compile(r"\s+")
 
 threshold = 0.70
 
+list_classes = frozenset(
+    {
+        "android.view.ViewGroup",
+        "android.widget.GridView",
+        "android.widget.ListView",
+        "android.widget.FrameLayout",
+        "android.widget.GridLayout",
+        "android.widget.LinearLayout",
+        "android.widget.RelativeLayout",
+        "androidx.recyclerview.widget.RecyclerView",
+    }
+)
+"""列表组件的类型"""
+
+excluded_classes = frozenset(
+    {
+        "android.widget.CheckBox",
+        "android.widget.EditText",
+        "android.widget.Switch",
+    }
+)
+"""不能通过点击交互的组件类型，不参与截屏特征点匹配与优化探索"""
+
+
+def squeeze_spaces(s: str) -> str:
+    """将连续空白字符替换为单个空格
+
+    只含单个空格且没有其他空白字符的字符串无需替换，直接返回
+
+    Args:
+        s (str): 字符串
+
+    Returns:
+        str: 替换后的字符串
+    """
+    if "  " not in s and s.isprintable():
+        return s
+    return space_regex.sub(" ", s)
+
+
+def process_id(s: str) -> str:
+    """去掉 resource-id 中的包名前缀
+
+    Args:
+        s (str): resource-id
+
+    Returns:
+        str: id 内容，不符合格式时原样返回
+    """
+    if len(s) == 0:
+        return s
+    else:
+        if match := id_regex.match(s):
+            return match.group("content")
+        else:
+            logger.warning(f"resource-id not match pattern: {s}")
+            return s
+
+
+@lru_cache(maxsize=8192)
+def normalize(raw: str, is_id: bool = False) -> str | None:
+    """规范化属性值，用于属性比较
+
+    同一属性值在匹配中会与大量组件比较，结果按原始字符串缓存
+
+    Args:
+        raw (str): 原始属性值
+        is_id (bool, optional): 是否为 resource-id. Defaults to False.
+
+    Returns:
+        str | None: 小写且合并空白后的属性值，属性为空时返回 None
+    """
+    s = raw.strip().lower()
+    if is_id:
+        s = process_id(s)
+    if s == "":
+        return None
+    s = squeeze_spaces(s)
+    # 去掉前缀后的 id 可能以空白开头，其余情况已经去除首尾空白且为小写
+    return s.strip() if is_id else s
+
 
 def attr_equal(a: Element, b: Element, name1: str, name2: str | None = None) -> bool:
     """判定两个节点的某属性是否相等
@@ -30,15 +115,10 @@ def attr_equal(a: Element, b: Element, name1: str, name2: str | None = None) ->
     Returns:
         bool: 是否相等
     """
-    attr_a = a.get(name1, "").strip().lower()
-    if name2 is None:
-        attr_b = b.get(name1, "").strip().lower()
-    else:
-        attr_b = b.get(name2, "").strip().lower()
-    if attr_a == "" or attr_b == "":
+    attr_a = normalize(a.get(name1, ""))
+    attr_b = normalize(b.get(name1 if name2 is None else name2, ""))
+    if attr_a is None or attr_b is None:
         return False
-    attr_a = re.sub(r"\s+", " ", attr_a).strip()
-    attr_b = re.sub(r"\s+", " ", attr_b).strip()
 
     return attr_a == attr_b
 
@@ -57,37 +137,33 @@ def attr_like(a: Element, b: Element, name1: str, name2: str | None = None) -> b
     Returns:
         bool: 是否相似
     """
+    if name2 is None:
+        name2 = name1
+    attr_a = normalize(a.get(name1, ""), name1 == "resource-id")
+    attr_b = normalize(b.get(name2, ""), name2 == "resource-id")
+    return similar(attr_a, attr_b)
 
-    def process_id(s: str) -> str:
-        if len(s) == 0:
-            return s
-        else:
-            if match := re.match(id_pattern, s):
-                return match.group("content")
-            else:
-                logger.warning(f"resource-id not match pattern: {s}")
-                return s
-
-    attr_a = a.get(name1, "").strip().lower()
-    if name1 == "resource-id":
-        attr_a = process_id(attr_a)
-    attr_b = (
-        b.get(name1, "").strip().lower()
-        if name2 is None
-        else b.get(name2, "").strip().lower()
-    )
-    if (name2 is None and name1 == "resource-id") or (
-        name2 is not None and name2 == "resource-id"
-    ):
-        attr_b = process_id(attr_b)
 
-    if attr_a == "" or attr_b == "":
+def similar(attr_a: str | None, attr_b: str | None) -> bool:
+    """判定两个规范化后的属性值是否相似
+
+    Args:
+        attr_a (str | None): 组件 A 的属性值
+        attr_b (str | None): 组件 B 的属性值
+
+    Returns:
+        bool: 是否相似，有一个属性为空时不相似
+    """
+    if attr_a is None or attr_b is None:
         return False
 
-    attr_a = re.sub(r"\s+", " ", attr_a).strip().lower()
-    attr_b = re.sub(r"\s+", " ", attr_b).strip().lower()
+    # 相似度不超过 2 * min(la, lb) / (la + lb)，长度相差过大时无需计算
+    la, lb = len(attr_a), len(attr_b)
+    if 2 * min(la, lb) < threshold * (la + lb):
+        return False
 
-    similarity = ratio(attr_a, attr_b)
+    # 低于阈值时提前结束计算并返回 0
+    similarity = Indel.normalized_similarity(attr_a, attr_b, score_cutoff=threshold)
     return similarity >= threshold
 
 
@@ -100,16 +176,7 @@ def is_list(node: Element) -> bool:
     Returns:
         bool: 是否为列表组件
     """
-    return node.get("class") in {
-        "android.view.ViewGroup",
-        "android.widget.GridView",
-        "android.widget.ListView",
-        "android.widget.FrameLayout",
-        "android.widget.GridLayout",
-        "android.widget.LinearLayout",
-        "android.widget.RelativeLayout",
-        "androidx.recyclerview.widget.RecyclerView",
-    }
+    return node.get("class") in list_classes
 
 
 def is_child(node: Element) -> bool:
@@ -129,28 +196,31 @@ def is_child(node: Element) -> bool:
     Returns:
         bool: 判断结果
     """
+    attrib = node.attrib
     if len(node) != 0:
         return False
 
-    if node.get("resource-id", "").startswith("com.google.android.inputmethod"):
+    if attrib.get("resource-id", "").startswith("com.google.android.inputmethod"):
         # 输入法
         return False
 
-    if node.get("w") == "0" or node.get("h") == "0":
+    if attrib.get("w") == "0" or attrib.get("h") == "0":
         return False
 
-    if int(node.get("w", "0")) * int(node.get("h", "0")) >= 1080 * 1920 * 0.6:
+    w, h = int(attrib.get("w", "0")), int(attrib.get("h", "0"))
+    if w * h >= 1080 * 1920 * 0.6:
         # too big
         return False
 
-    not_list = not is_list(node)
-    has_text = node.get("text") != ""
+    # 缺少某个属性时，该属性视为不为空
     not_empty = (
-        has_text or node.get("content-desc") != "" or node.get("resource-id") != ""
+        attrib.get("text") != ""
+        or attrib.get("content-desc") != ""
+        or attrib.get("resource-id") != ""
     )
-    big_enough = int(node.get("w", "0")) >= 15 and int(node.get("h", "0")) >= 15
+    big_enough = w >= 15 and h >= 15
 
-    return not_list and (not_empty or big_enough)
+    return attrib.get("class") not in list_classes and (not_empty or big_enough)
 
 
 def is_parent(node: Element) -> bool:
@@ -167,10 +237,13 @@ def is_parent(node: Element) -> bool:
     Returns:
         bool: 是否为父节点
     """
-    if node.get("w") == "0" or node.get("h") == "0":
+    attrib = node.attrib
+    if attrib.get("w") == "0" or attrib.get("h") == "0":
         return False
 
-    not_empty = node.get("resource-id", "") != "" or node.get("content-desc", "") != ""
+    not_empty = (
+        attrib.get("resource-id", "") != "" or attrib.get("content-desc", "") != ""
+    )
 
     return not_empty and (len(node) > 0 or is_list(node))
 
@@ -197,16 +270,44 @@ def is_cover(a: Element, b: Element) -> bool:
     Returns:
         bool: 是否覆盖
     """
-    ax0, ay0, ax1, ay1 = coordinates(a)
-    bx0, by0, bx1, by1 = coordinates(b)
-    center_x, center_y = (bx0 + bx1) / 2, (by0 + by1) / 2
+    return covers(coordinates(a), coordinates(b))
 
-    h_cover = ax0 <= center_x <= ax1
-    v_cover = ay0 <= center_y <= ay1
+
+def covers(a: Coordinate, b: Coordinate) -> bool:
+    """与 `is_cover` 相同，直接使用已解析的坐标判断
+
+    Args:
+        a (Coordinate): 组件 A 的坐标
+        b (Coordinate): 组件 B 的坐标
+
+    Returns:
+        bool: 是否覆盖
+    """
+    center_x, center_y = (b.x0 + b.x1) / 2, (b.y0 + b.y1) / 2
+
+    h_cover = a.x0 <= center_x <= a.x1
+    v_cover = a.y0 <= center_y <= a.y1
 
     return h_cover and v_cover
 
 
+def cover_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """与 `covers` 相同，两两判断一组组件是否覆盖另一组组件
+
+    Args:
+        a (np.ndarray): 形状为 (N, 4) 的坐标数组
+        b (np.ndarray): 形状为 (M, 4) 的坐标数组
+
+    Returns:
+        np.ndarray: 形状为 (N, M) 的 bool 数组，第 i 行第 j 列表示 a[i] 是否覆盖 b[j]
+    """
+    # 中心坐标乘 2 后比较，避免浮点运算
+    cx, cy = (b[:, 0] + b[:, 2])[None, :], (b[:, 1] + b[:, 3])[None, :]
+    ax0, ay0, ax1, ay1 = (2 * a[:, k : k + 1] for k in range(4))
+    result: np.ndarray = (ax0 <= cx) & (cx <= ax1) & (ay0 <= cy) & (cy <= ay1)
+    return result
+
+
 def is_overlap(a: Element, b: Element) -> bool:
     """判断两个组件是否有重叠
 
@@ -217,6 +318,9 @@ def is_overlap(a: Element, b: Element) -> bool:
     >>> b = fromstring(b_str)
     >>> is_overlap(a, b)
     True
+    >>> c = fromstring("<node bounds='[400, 100][500, 300]' />")
+    >>> is_overlap(a, c)
+    False
 
     Args:
         a (Element): 组件 A
@@ -228,11 +332,24 @@ def is_overlap(a: Element, b: Element) -> bool:
     ax0, ay0, ax1, ay1 = coordinates(a)
     bx0, by0, bx1, by1 = coordinates(b)
 
-    xmin, xmax = min(ax1, ax1), max(ax0, bx0)
-    h_overlap = xmin > xmax
-    ymin, ymax = min(ay1, by1), max(ay0, by0)
-    v_overlap = ymin > ymax
-    return h_overlap and v_overlap
+    return ax0 < bx1 and bx0 < ax1 and ay0 < by1 and by0 < ay1
+
+
+def overlaps(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """与 `is_overlap` 相同，判断组件 A 与一组组件是否有重叠
+
+    Args:
+        a (np.ndarray): 组件 A 的坐标 x0 y0 x1 y1
+        b (np.ndarray): 形状为 (N, 4) 的坐标数组
+
+    Returns:
+        np.ndarray: 长度为 N 的 bool 数组
+    """
+    ax0, ay0, ax1, ay1 = a
+    bx0, by0, bx1, by1 = b.T
+
+    result: np.ndarray = (ax0 < bx1) & (bx0 < ax1) & (ay0 < by1) & (by0 < ay1)
+    return result
 
 
 def is_match(a: Element, b: Element, *, strict: bool = True) -> bool:
@@ -280,32 +397,39 @@ def is_like(a: Element, b: Element, strict: bool = True) -> bool:
     Returns:
         bool: 匹配结果
     """
+    a_class, b_class = a.get("class"), b.get("class")
+    # 先判断开销小的条件，最后才计算相似度
     if (
-        a.get("text", "") == ""
+        a_class == "android.widget.EditText"
+        and b_class == a_class
+        and a.get("text", "") == ""
         and b.get("text", "") == ""
         and a.get("content-desc", "") == ""
         and b.get("content-desc", "") == ""
         and attr_like(a, b, "resource-id")
-        and a.get("class", "") == b.get("class", "")
-        and a.get("class") in {"android.widget.EditText"}
     ):
         return True
 
-    if (attr_like(a, b, "resource-id") or not strict) and (
-        attr_like(a, b, "text")
-        or attr_like(a, b, "content-desc")
-        or attr_like(a, b, "text", "content-desc")
-        or attr_like(a, b, "content-desc", "text")
+    # 每个属性只规范化一次，在各个分支中复用
+    a_text, b_text = normalize(a.get("text", "")), normalize(b.get("text", ""))
+    a_desc = normalize(a.get("content-desc", ""))
+    b_desc = normalize(b.get("content-desc", ""))
+
+    if (not strict or attr_like(a, b, "resource-id")) and (
+        similar(a_text, b_text)
+        or similar(a_desc, b_desc)
+        or similar(a_text, b_desc)
+        or similar(a_desc, b_text)
     ):
         return True
 
     if (
         (
-            attr_equal(a, b, "text", "content-desc")
-            or attr_equal(a, b, "content-desc", "text")
+            (a_text is not None and a_text == b_desc)
+            or (a_desc is not None and a_desc == b_text)
         )
-        and a.get("class") not in {"android.widget.RadioButton"}
-        and b.get("class") not in {"android.widget.RadioButton"}
+        and a_class != "android.widget.RadioButton"
+        and b_class != "android.widget.RadioButton"
     ):
         return True
 
@@ -355,6 +479,8 @@ def tree_equal(a: Element, b: Element) -> bool:
     >>> b = "<node><node b='b' a='a' /></node>"
     >>> tree_equal(fromstring(a), fromstring(b))
     True
+    >>> tree_equal(fromstring(a), fromstring("<node><node a='a' /></node>"))
+    False
 
     Args:
         a (Element): 根节点 A
@@ -363,10 +489,44 @@ def tree_equal(a: Element, b: Element) -> bool:
     Returns:
         bool: 是否完全相等
     """
-    data_a = tostring(a, encoding="unicode")
-    data_b = tostring(b, encoding="unicode")
+    # 属性字典的比较与顺序无关，无需序列化后规范化
+    if (
+        a.tag != b.tag
+        or (a.text or "") != (b.text or "")
+        or (a.tail or "") != (b.tail or "")
+        or a.attrib != b.attrib
+        or len(a) != len(b)
+    ):
+        return False
+    return all(tree_equal(x, y) for x, y in zip(a, b))
 
-    return canonicalize(data_a) == canonicalize(data_b)
+
+def tree_hash(node: Element) -> int:
+    """计算 xml 树的结构哈希，判等标准与 `tree_equal` 一致
+
+    >>> from xml.etree.ElementTree import fromstring
+    >>> a = "<node><node a='a' b='b' /></node>"
+    >>> b = "<node><node b='b' a='a' /></node>"
+    >>> tree_hash(fromstring(a)) == tree_hash(fromstring(b))
+    True
+    >>> tree_hash(fromstring(a)) == tree_hash(fromstring("<node><node a='a' /></node>"))
+    False
+
+    Args:
+        node (Element): 根节点
+
+    Returns:
+        int: 哈希值
+    """
+    return hash(
+        (
+            node.tag,
+            node.text or "",
+            node.tail or "",
+            frozenset(node.attrib.items()),
+            tuple(tree_hash(x) for x in node),
+        )
+    )
 
 
 def is_in_bound(point: cv2.KeyPoint, node: Element) -> bool:
@@ -379,6 +539,43 @@ def is_in_bound(point: cv2.KeyPoint, node: Element) -> bool:
     return x < px < x + w and y < py < y + h
 
 
+def points_in_bounds(points: np.ndarray, bbox: np.ndarray) -> np.ndarray:
+    """与 `is_in_bound` 相同，判断一组点分别是否位于一组组件内
+
+    Args:
+        points (np.ndarray): 形状为 (K, 2) 的点坐标数组
+        bbox (np.ndarray): 形状为 (N, 4) 的组件坐标数组
+
+    Returns:
+        np.ndarray: 形状为 (K, N) 的 bool 数组
+    """
+    px, py = points[:, 0:1], points[:, 1:2]
+    result: np.ndarray = (
+        (bbox[:, 0] < px) & (px < bbox[:, 2]) & (bbox[:, 1] < py) & (py < bbox[:, 3])
+    )
+    return result
+
+
+def assign_points(
+    points: np.ndarray, bbox: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """以类似 CSR 的形式记录每个点位于哪些组件内
+
+    第 k 个点所在组件的下标为 cols[rowptr[k] : rowptr[k + 1]]
+
+    Args:
+        points (np.ndarray): 形状为 (K, 2) 的点坐标数组
+        bbox (np.ndarray): 形状为 (N, 4) 的组件坐标数组
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: 长度为 K + 1 的 rowptr 与组件下标 cols
+    """
+    rows, cols = np.nonzero(points_in_bounds(points, bbox))
+    rowptr = np.zeros(len(points) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=len(points)), out=rowptr[1:])
+    return rowptr, cols
+
+
 def default_filter(candidates: Iterable[Element]) -> list[Element]:
     return [c for c in candidates]
 
@@ -403,77 +600,65 @@ def optimize_filter_generator(
 
     def func(candidates: Iterable[Element]) -> list[Element]:
         result: list[Element] = []
-
-        # 先过滤掉不能点击交互的控件
-        candidates = filter(
-            lambda x: x.get("class", "")
-            not in {
-                "android.widget.CheckBox",
-                "android.widget.EditText",
-                "android.widget.Switch",
-            },
-            candidates,
-        )
-        temp: dict[Element, list[Element]] = defaultdict(list)
+        temp: dict[Element, list[Element]] = dict()
         for candidate in candidates:
-            if candidate not in non_overlap:
+            # 过滤掉不能点击交互的控件
+            if candidate.get("class", "") in excluded_classes:
+                continue
+            if (parent := non_overlap.get(candidate)) is None:
                 result.append(candidate)
             else:
-                temp[non_overlap[candidate]].append(candidate)
+                temp.setdefault(parent, []).append(candidate)
 
         for siblings in temp.values():
             if len(siblings) == 1:
                 result.append(siblings[0])
             else:
-                result.append(sorted(siblings, key=key)[0])
+                result.append(min(siblings, key=key))
 
         return result
 
     return func
 
 
-class CustomKey(NamedTuple):
-    id_unique: int
-    text_unique: int
-    desc_unique: int
-    id_empty: int
-    text_empty: int
-    desc_empty: int
-    id_num: int
-    text_num: int
-    desc_num: int
-    y0: int
-    x0: int
-
-
 def optimize_key_generator(
     candidates: Iterable[Element],
 ) -> Callable[[Element], tuple[float, ...]]:
-    id_counter = Counter([candidate.get("resource-id", "") for candidate in candidates])
-    text_counter = Counter([candidate.get("text", "") for candidate in candidates])
-    desc_counter = Counter(
-        [candidate.get("content-desc", "") for candidate in candidates]
+    id_counter: Counter[str] = Counter()
+    text_counter: Counter[str] = Counter()
+    desc_counter: Counter[str] = Counter()
+    # 只遍历一次候选组件，同时统计三个属性
+    for candidate in candidates:
+        attrib = candidate.attrib
+        id_counter[attrib.get("resource-id", "")] += 1
+        text_counter[attrib.get("text", "")] += 1
+        desc_counter[attrib.get("content-desc", "")] += 1
+
+    id_num, text_num, desc_num = (
+        id_counter.__getitem__,
+        text_counter.__getitem__,
+        desc_counter.__getitem__,
     )
 
     def func(candidate: Element) -> tuple[float, ...]:
-        resource_id = candidate.get("resource-id", "")
-        text = candidate.get("text", "")
-        content_desc = candidate.get("content-desc", "")
+        attrib = candidate.attrib
+        resource_id = attrib.get("resource-id", "")
+        text = attrib.get("text", "")
+        content_desc = attrib.get("content-desc", "")
         coord = coordinates(candidate)
-        return tuple(
-            CustomKey(
-                0 if resource_id != "" and id_counter[resource_id] == 1 else 1,
-                0 if text != "" and text_counter[text] == 1 else 1,
-                0 if content_desc != "" and desc_counter[content_desc] == 1 else 1,
-                0 if resource_id == "" else 1,
-                0 if text == "" else 1,
-                0 if content_desc == "" else 1,
-                id_counter[resource_id],
-                text_counter[text],
-                desc_counter[content_desc],
-                coord.y0,
-                coord.x0,
-            )
+        # 依次为：属性是否唯一、属性是否为空、属性出现次数、纵坐标、横坐标
+        return (
+            0 if resource_id != "" and id_num(resource_id) == 1 else 1,
+            0 if text != "" and text_num(text) == 1 else 1,
+            0 if content_desc != "" and desc_num(content_desc) == 1 else 1,
+            0 if resource_id == "" else 1,
+            0 if text == "" else 1,
+            0 if content_desc == "" else 1,
+            id_num(resource_id),
+            text_num(text),
+            desc_num(content_desc),
+            coord.y0,
+            coord.x0,
         )
 
     return func
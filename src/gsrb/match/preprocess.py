@@ -1,5 +1,7 @@
 import logging
-from collections import defaultdict
+import sys
+from collections.abc import Iterable
+from functools import lru_cache
 from typing import Callable
 from xml.etree.ElementTree import Element
 
@@ -7,6 +9,15 @@ from gsrb.utils.element import coordinates
 
 logger = logging.getLogger(__name__)
 
+index_attrs = ("class", "resource-id", "content-desc", "text")
+"""需要标记 index 的属性"""
+
+interned_attrs = ("class", "resource-id", "package")
+"""布局中大量重复、需要驻留的属性"""
+
+index_strs = tuple(str(i) for i in range(1024))
+"""预先转换好的 index 字符串，各节点共享同一对象"""
+
 
 def preprocess(node: Element) -> None:
     """对根节点进行预处理
@@ -24,8 +35,17 @@ def preprocess(node: Element) -> None:
         node,
         lambda n: n.get("package") == "com.android.systemui",
     )
-    denote_index(node)
-    denote_bounds(node)
+    # 只遍历一次布局树，标注坐标的同时收集节点，再按属性逐列标注 index
+    nodes: list[Element] = []
+    for child in node.iter("node"):
+        # 驻留后重复的属性值共享同一对象，比较时可以直接比较引用
+        attrib = child.attrib
+        for k in interned_attrs:
+            if (v := attrib.get(k)) is not None:
+                attrib[k] = sys.intern(v)
+        denote_node_bounds(child)
+        nodes.append(child)
+    denote_nodes_index(nodes)
 
 
 def remove_node(node: Element, predictor: Callable[[Element], bool]) -> None:
@@ -45,29 +65,65 @@ def remove_node(node: Element, predictor: Callable[[Element], bool]) -> None:
         node.remove(child)
 
 
+def denote_nodes_index(nodes: Iterable[Element]) -> None:
+    """根据节点属性值在给定节点中出现的次序为其标记 index
+
+    各属性的计数互不相关，逐个属性遍历节点，每次只维护一个计数器
+
+    Args:
+        nodes (Iterable[Element]): 按先序遍历顺序排列的节点
+    """
+    attribs = [
+        n.attrib
+        for n in nodes
+        if not n.get("resource-id", "").startswith("com.google.android")
+    ]
+    for k in index_attrs:
+        key = f"{k}-index"
+        counter: dict[str, int] = {}
+        for attrib in attribs:
+            if (v := attrib.get(k, "")) != "":
+                i = counter.get(v, 0)
+                attrib[key] = index_strs[i] if i < len(index_strs) else str(i)
+                counter[v] = i + 1
+            else:
+                # 不考虑空属性的 index，一律设置为 -1
+                attrib[key] = "-1"
+
+
+@lru_cache(maxsize=8192)
+def bounds_attrs(bounds: str) -> tuple[tuple[str, str], ...]:
+    """将 bounds 属性转换为左上角坐标与宽高属性，结果按字符串缓存
+
+    >>> bounds_attrs("[10,20][30,60]")
+    (('x', '10'), ('y', '20'), ('w', '20'), ('h', '40'))
+
+    Args:
+        bounds (str): bounds 属性
+
+    Returns:
+        tuple[tuple[str, str], ...]: 依次为 x y w h 属性
+    """
+    x0, y0, x1, y1 = coordinates(bounds)
+    return (("x", str(x0)), ("y", str(y0)), ("w", str(x1 - x0)), ("h", str(y1 - y0)))
+
+
+def denote_node_bounds(child: Element) -> None:
+    """根据节点的 bounds 属性，为单个节点标注左上角坐标与宽高
+
+    Args:
+        child (Element): 节点
+    """
+    child.attrib.update(bounds_attrs(child.get("bounds", "[0,0][0,0]")))
+
+
 def denote_index(node: Element) -> None:
     """根据节点属性值在全文中出现的次序为其标记 index
 
     Args:
         node (Element): 根节点
     """
-    counters: dict[str, defaultdict[str, int]] = {
-        "class": defaultdict(int),
-        "resource-id": defaultdict(int),
-        "content-desc": defaultdict(int),
-        "text": defaultdict(int),
-    }
-
-    for child in node.iter("node"):
-        if child.get("resource-id", "").startswith("com.google.android"):
-            continue
-        for k, c in counters.items():
-            if child.get(k, "") != "":
-                child.set(f"{k}-index", str(c[child.get(k, "")]))
-                c[child.get(k, "")] += 1
-            else:
-                # 不考虑空属性的 index，一律设置为 -1
-                child.set(f"{k}-index", str(-1))
+    denote_nodes_index(node.iter("node"))
 
 
 def denote_bounds(node: Element) -> None:
@@ -77,7 +133,4 @@ def denote_bounds(node: Element) -> None:
         node (Element): 节点
     """
     for child in node.iter("node"):
-        x0, y0, x1, y1 = coordinates(child)
-        child.attrib.update(
-            {"x": str(x0), "y": str(y0), "w": str(x1 - x0), "h": str(y1 - y0)}
-        )
+        denote_node_bounds(child)
@@ -1,8 +1,11 @@
+import hashlib
 import json
 import logging
+import os
+import threading
 import time
-from datetime import datetime
 from importlib.resources import files
+from pathlib import Path
 from traceback import format_exc
 from typing import Literal, TypedDict
 
@@ -31,24 +34,78 @@ class Message(TypedDict):
 Candidate = dict[str, str]
 
 
-last_request = datetime(1970, 1, 1)
+request_interval = 30
+"""两次请求 chatgpt 之间的最小间隔秒数"""
+next_request = 0.0
+"""下一次可以请求 chatgpt 的时刻，取值为 time.monotonic()"""
+request_lock = threading.Lock()
+"""保护 next_request，每个请求在锁内预约发出的时刻，在锁外等待"""
+
+answers_cache_dir = Path.home() / ".cache" / "gsrb" / "answers"
+"""chatgpt 回答的缓存目录，以布局摘要的哈希为文件名"""
+answers: dict[str, list[Candidate]] = {}
+"""本次运行中已经得到的回答"""
+
+
+def load_answer(key: str) -> list[Candidate] | None:
+    """读取缓存的回答
+
+    Args:
+        key (str): 布局摘要的哈希
+
+    Returns:
+        list[Candidate] | None: 回答，没有缓存时返回 None
+    """
+    if key in answers:
+        return answers[key]
+    try:
+        cached: list[Candidate] = json.loads(
+            (answers_cache_dir / f"{key}.json").read_text(encoding="utf-8")
+        )
+    except (OSError, json.JSONDecodeError):
+        return None
+    answers[key] = cached
+    return cached
+
+
+def save_answer(key: str, candidates: list[Candidate]) -> None:
+    """缓存回答，同时写入内存与磁盘
+
+    Args:
+        key (str): 布局摘要的哈希
+        candidates (list[Candidate]): 回答
+    """
+    answers[key] = candidates
+    try:
+        answers_cache_dir.mkdir(parents=True, exist_ok=True)
+        cache = answers_cache_dir / f"{key}.json"
+        tmp = cache.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(candidates, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(cache)
+    except OSError:
+        logger.warning(f"cannot write answer cache {key}")
 
 
 def ask(layout: Layout) -> list[Candidate]:
-    global last_request
+    global next_request
     # prepare input
     digest = layout.digest
+    # 相同的界面直接使用之前的回答，不再请求 chatgpt
+    key = hashlib.blake2b(digest.encode("utf-8"), digest_size=16).hexdigest()
+    if (cached := load_answer(key)) is not None:
+        logger.debug(f"cached answer for {key}")
+        return cached
     chat = [
         {"role": "system", "content": prompt},
         {"role": "user", "content": digest},
     ]
     logger.debug(f"layout digest: {digest}")
 
-    # check & update last request time
-    now = datetime.now()
-    if (interval := (now - last_request).total_seconds()) < 30:
-        time.sleep(30 - interval)
-    last_request = datetime.now()
+    # 预约请求时刻，多个线程的请求依次间隔 request_interval 发出，各自等待不互相阻塞
+    with request_lock:
+        start = max(time.monotonic(), next_request)
+        next_request = start + request_interval
+    time.sleep(max(0.0, start - time.monotonic()))
 
     # ask chatgpt
     try:
@@ -75,6 +132,7 @@ def ask(layout: Layout) -> list[Candidate]:
         logger.error(f"deserialize failed {format_exc()}")
         return []
 
+    save_answer(key, candidates)
     return candidates
 
 
@@ -2,10 +2,11 @@ import logging
 import re
 import time
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import replace
 from pathlib import Path
 from typing import Callable
-from xml.etree.ElementTree import fromstring
+from xml.etree.ElementTree import Element, fromstring
 
 from uiautomator2 import Device
 
@@ -32,9 +33,15 @@ assertion_pattern = (
     r"^(?P<intent>\s*?)assert\s+?(?P<not>not\s+?)?(?P<statement>.*?)\.exists$"
 )
 extend_assertion_pattern = r'^(?P<intent>\s*?)assert\s+?(?P<statement>.*?)\.info\["(?P<attr>.*?)"\]\s*(?:(?P<eq>==)|(?P<ne>!=))\s*"(?P<oracle>.*?)"'  # noqa
+regex = re.compile(pattern)
+assertion_regex = re.compile(assertion_pattern)
+extend_assertion_regex = re.compile(extend_assertion_pattern)
 
 record_interval = 0.5
 
+assertion_workers = 4
+"""并发请求断言的最大线程数"""
+
 PostProcessor = Callable[[list[Step]], None]
 
 
@@ -81,7 +88,11 @@ class RecordManager:
 
 def save_to_zip(target: Path, pretest: str | None, draw: bool) -> PostProcessor:
     def func(steps: list[Step]) -> None:
-        with zipfile.ZipFile(target, "w") as zf:
+        # 截屏本身已经压缩，直接存储；文本内容使用 deflate 压缩
+        deflated = zipfile.ZIP_DEFLATED
+        with zipfile.ZipFile(
+            target, "w", compression=zipfile.ZIP_STORED, allowZip64=True
+        ) as zf:
             for i, step in enumerate(steps):
                 if not draw:
                     zf.writestr(f"ui/{i * 2}.png", step.ui_before.p)
@@ -92,16 +103,16 @@ def save_to_zip(target: Path, pretest: str | None, draw: bool) -> PostProcessor:
                             step.ui_before.p, step.ui_before.x, step.event.locator
                         ),
                     )
-                zf.writestr(f"ui/{i * 2}.xml", step.ui_before.x)
+                zf.writestr(f"ui/{i * 2}.xml", step.ui_before.x, deflated)
                 zf.writestr(f"ui/{i * 2 + 1}.png", step.ui_after.p)
-                zf.writestr(f"ui/{i * 2 + 1}.xml", step.ui_after.x)
+                zf.writestr(f"ui/{i * 2 + 1}.xml", step.ui_after.x, deflated)
 
             content = "\n".join([x.event.to_json() for x in steps])
-            zf.writestr("record.txt", content)
+            zf.writestr("record.txt", content, deflated)
             if pretest is not None:
-                zf.writestr("pretest.py", pretest)
+                zf.writestr("pretest.py", pretest, deflated)
 
-            zf.writestr("gsrb.debug.log", log_in_memory.getvalue())
+            zf.writestr("gsrb.debug.log", log_in_memory.getvalue(), deflated)
 
     return func
 
@@ -109,13 +120,20 @@ def save_to_zip(target: Path, pretest: str | None, draw: bool) -> PostProcessor:
 def generate_assertion(target: Path) -> PostProcessor:
     def func(steps: list[Step]) -> None:
         target_indices = get_target_indices(steps)
+        # 请求在线程中并发进行，ask 内部保证请求的发出间隔
+        workers = max(1, min(assertion_workers, len(target_indices)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                i: executor.submit(
+                    retry_ask, Layout(steps[i].ui_after.x, steps[i].ui_after.p)
+                )
+                for i in sorted(target_indices)
+            }
         new_events: list[Event] = []
         for i, step in enumerate(steps):
             new_events.append(step.event)
-            if i in target_indices:
-                layout = Layout(step.ui_after.x, step.ui_after.p)
-                candidates = retry_ask(layout)
-                event = to_assertion(select_candidate(candidates))
+            if i in futures:
+                event = to_assertion(select_candidate(futures[i].result()))
                 if event is None:
                     continue
                 new_events.append(event)
@@ -124,6 +142,7 @@ def generate_assertion(target: Path) -> PostProcessor:
             zf.writestr(
                 "record_with_assertion.txt",
                 "\n".join([e.to_json() for e in new_events]),
+                zipfile.ZIP_DEFLATED,
             )
 
     return func
@@ -141,13 +160,16 @@ def rewrite_script(target: Path) -> PostProcessor:
                 "",
             ]
         )
+        roots: dict[str, Element] = {}
         for step in steps:
             if step.event.locator is None:
                 lines.append(f"    {step.event.generate_u2('d')}")
                 continue
-            root = fromstring(step.ui_before.x)
+            # 相同的界面只解析与预处理一次
+            if (root := roots.get(step.ui_before.x)) is None:
+                root = roots[step.ui_before.x] = fromstring(step.ui_before.x)
+                xml_preprocess(root)
             locator = step.event.locator
-            xml_preprocess(root)
             node = locator.find_in_layout(root)
             if node is None:
                 logger.error(f"cannot find node for locator: {locator}")
@@ -178,7 +200,7 @@ def preprocess(script: str, package: str, addr: str, *, record: bool = True) ->
     if record:
         lines.insert(0, "from gsrb.record.my_device import MyDevice")
     for i in range(len(lines)):
-        if match := re.match(pattern, lines[i]):
+        if match := regex.match(lines[i]):
             # 主要工作是添加运行脚本的设备序列号
             intent: str = "" if not match.group("intent") else match.group("intent")
             device_name: str = match.group("device")
@@ -190,14 +212,14 @@ def preprocess(script: str, package: str, addr: str, *, record: bool = True) ->
                 lines[i] += f'\n{intent}init_app({device_name}, "{package}", pretest)'
         # 处理断言
         if record:
-            if (match := re.match(assertion_pattern, lines[i])) is not None:
+            if (match := assertion_regex.match(lines[i])) is not None:
                 intent = "" if not match.group("intent") else match.group("intent")
                 not_exists = match.group("not") is not None
                 statement: str = match.group("statement")
                 lines[
                     i
                 ] = f"{intent}{statement}.assert_{'not_' if not_exists else ''}exists()"
-            if (match := re.match(extend_assertion_pattern, lines[i])) is not None:
+            if (match := extend_assertion_regex.match(lines[i])) is not None:
                 intent = "" if not match.group("intent") else match.group("intent")
                 eq = match.group("eq") is not None
                 statement = match.group("statement")
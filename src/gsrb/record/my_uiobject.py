@@ -1,70 +1,72 @@
+from collections.abc import Callable
+from typing import TypeVar
+
 from uiautomator2 import UiObject
 
 from gsrb.common.action import Action
 from gsrb.common.event import Event
+from gsrb.common.locator import Locator
 from gsrb.record.manager import RecordManager
 
+T = TypeVar("T")
+
 
 class MyUiObject(UiObject):
     manager: RecordManager | None = None
+    locator: Locator | None = None
+    """由 MyDevice 在创建对象时设置"""
+
+    def __track(self, event: Event, call: Callable[[], T]) -> T:
+        """执行动作，有 manager 时在动作前后记录界面与事件
+
+        Args:
+            event (Event): 动作对应的事件
+            call (Callable[[], T]): 实际执行的动作
+
+        Returns:
+            T: 动作的返回值
+        """
+        if (manager := self.manager) is None:
+            return call()
+        manager.before()
+        result = call()
+        manager.after(event)
+        return result
 
     def click(
         self, timeout: float | None = None, offset: tuple[float, float] | None = None
     ) -> None:
-        if self.manager:
-            event = Event(Action.CLICK, self.__dict__.get("locator", None))
-            self.manager.before()
-            super().click(timeout, offset)
-            self.manager.after(event)
+        self.__track(
+            Event(Action.CLICK, self.locator),
+            lambda: super(MyUiObject, self).click(timeout, offset),
+        )
 
     def long_click(self, duration: float = 0.5, timeout: float | None = None) -> object:
-        if self.manager:
-            event = Event(Action.LONG_CLICK, self.__dict__.get("locator", None))
-            self.manager.before()
-            result = super().long_click(duration, timeout)
-            self.manager.after(event)
-            return result
-        return super().long_click(duration, timeout)
+        return self.__track(
+            Event(Action.LONG_CLICK, self.locator),
+            lambda: super(MyUiObject, self).long_click(duration, timeout),
+        )
 
     def set_text(self, text: str, timeout: float | None = None) -> object:
-        if self.manager:
-            event = Event(
-                Action.SET_TEXT, self.__dict__.get("locator", None), {"text": text}
-            )
-            self.manager.before()
-            result = super().set_text(text, timeout)
-            self.manager.after(event)
-            return result
-        return super().set_text(text, timeout)
+        return self.__track(
+            Event(Action.SET_TEXT, self.locator, {"text": text}),
+            lambda: super(MyUiObject, self).set_text(text, timeout),
+        )
 
     def assert_exists(self) -> None:
-        if self.manager:
-            event = Event(Action.EXIST, self.__dict__.get("locator", None))
-            self.manager.before()
-            self.manager.after(event)
+        self.__track(Event(Action.EXIST, self.locator), lambda: None)
 
     def assert_not_exists(self) -> None:
-        if self.manager:
-            event = Event(Action.NOT_EXIST, self.__dict__.get("locator", None))
-            self.manager.before()
-            self.manager.after(event)
+        self.__track(Event(Action.NOT_EXIST, self.locator), lambda: None)
 
     def assert_equals(self, attr: str, oracle: str) -> None:
-        if self.manager:
-            event = Event(
-                Action.EQUAL,
-                self.__dict__.get("locator", None),
-                {"attr": attr, "oracle": oracle},
-            )
-            self.manager.before()
-            self.manager.after(event)
+        self.__track(
+            Event(Action.EQUAL, self.locator, {"attr": attr, "oracle": oracle}),
+            lambda: None,
+        )
 
     def assert_not_equals(self, attr: str, oracle: str) -> None:
-        if self.manager:
-            event = Event(
-                Action.NOT_EQUAL,
-                self.__dict__.get("locator", None),
-                {"attr": attr, "oracle": oracle},
-            )
-            self.manager.before()
-            self.manager.after(event)
+        self.__track(
+            Event(Action.NOT_EQUAL, self.locator, {"attr": attr, "oracle": oracle}),
+            lambda: None,
+        )
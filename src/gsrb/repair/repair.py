@@ -2,12 +2,12 @@ import logging
 import pprint
 import time
 import zipfile
-from copy import deepcopy
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import replace
 from pathlib import Path
 from typing import Literal, NoReturn
 
-from uiautomator2 import Device, connect
+from uiautomator2 import Device
 
 from gsrb.common.action import Action
 from gsrb.common.event import TEMPLATE_U2, Event
@@ -20,14 +20,21 @@ from gsrb.match.predictors import (
     default_key,
     optimize_filter_generator,
     optimize_key_generator,
-    tree_equal,
 )
-from gsrb.utils.app import get_version, init_app
+from gsrb.utils.app import get_device, get_version, init_app, screencap
 from gsrb.utils.logging import log_in_memory
 
 logger = logging.getLogger(__name__)
 
 
+class QuitRepair(Exception):
+    """结束修复，从任意深度的调用中返回到 `Repair.repair`"""
+
+    def __init__(self, succeed: bool) -> None:
+        super().__init__(succeed)
+        self.succeed = succeed
+
+
 class Repair:
     def __init__(
         self,
@@ -43,7 +50,7 @@ class Repair:
         remove_assertion: bool = False,
     ) -> None:
         # init device
-        self.device: Device = connect(device)
+        self.device: Device = get_device(device)
         self.device.implicitly_wait(3.0)
         logger.info(f"init device: {device}")
         logger.info(
@@ -106,6 +113,8 @@ class Repair:
 
         # 中间变量
         self.__current: int = 0
+        # 当前界面的布局缓存，执行操作或恢复应用后失效
+        self.__layout: Layout | None = None
         self.start_time = time.time()
         self.end_time = time.time()
         self.explore_time = 0
@@ -119,11 +128,25 @@ class Repair:
         logger.debug(f"update current from {self.__current} to {value}")
         self.__current = value
 
-    def repair(self) -> None:
+    def repair(self) -> bool:
+        """执行修复，结束时输出结果
+
+        不会退出进程，同一进程中可以依次执行多次修复
+
+        Returns:
+            bool: 修复是否成功
+        """
+        try:
+            self.__repair()
+        except QuitRepair as e:
+            return e.succeed
+
+    def __repair(self) -> NoReturn:
         self.start_time = time.time()
         # 打印修复信息
         logger.info("repair start")
         init_app(self.device, self.package, self.pretest)
+        self.__layout = None
 
         for i, step in enumerate(self.testcase):
             logger.info(f"step {i:>02}: {step}")
@@ -187,7 +210,7 @@ class Repair:
             cur_result = self.result[-1]
             logger.info(f"try to perform generated assertion {assertion_step}")
 
-            if assertion_step.event.perform(self.device):
+            if self.__perform(assertion_step.event):
                 logger.info("generated assertion succeeded")
                 new_step = assertion_step
             else:
@@ -203,17 +226,32 @@ class Repair:
         """将应用状态恢复到当前保存的已执行步骤"""
         logger.info("recovering...")
         init_app(self.device, self.package, self.pretest)
+        self.__layout = None
         for step in self.result:
             logger.debug(f"perform step {step}")
-            step.event.perform(self.device)
+            self.__perform(step.event)
+
+    def __perform(self, event: Event) -> bool:
+        """在设备上执行操作，并使布局缓存失效
+
+        Args:
+            event (Event): 待执行的操作
+
+        Returns:
+            bool: 是否执行成功
+        """
+        self.__layout = None
+        return event.perform(self.device)
 
     def __capture(self) -> Layout:
-        """捕获当前布局
+        """捕获当前布局，界面未被操作时复用上一次的结果
 
         Returns:
             Layout: 布局信息
         """
-        return Layout.from_device(self.device)
+        if self.__layout is None:
+            self.__layout = Layout.from_device(self.device)
+        return self.__layout
 
     def __quit(self, succeed: bool) -> NoReturn:
         """退出修复并输出结果
@@ -223,9 +261,12 @@ class Repair:
         """
         logger.info(f"repair {'failed' if not succeed else 'succeeded'}, quitting...")
         self.end_time = time.time()
-        self.__save(succeed)
-        self.device.app_stop(self.package)
-        exit(0 if succeed else -1)
+        # 写出结果只涉及本地文件，与停止应用的 adb 请求同时进行
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            saved = executor.submit(self.__save, succeed)
+            self.device.app_stop(self.package)
+            saved.result()
+        raise QuitRepair(succeed)
 
     def __save(self, succeed: bool) -> None:
         if succeed:
@@ -233,31 +274,39 @@ class Repair:
                 self.__generate(), encoding="utf-8"
             )
         if self.verbose_output is not None:
-            with zipfile.ZipFile(self.verbose_output, "w") as zf:
+            # 截屏本身已经压缩，直接存储；文本内容使用最快的 deflate 压缩
+            deflated = {"compress_type": zipfile.ZIP_DEFLATED, "compresslevel": 1}
+            with zipfile.ZipFile(
+                self.verbose_output,
+                "w",
+                compression=zipfile.ZIP_STORED,
+                allowZip64=True,
+            ) as zf:
                 for i, step in enumerate(self.result):
                     if step.has_ui():
                         zf.writestr(f"ui/{i * 2}.png", step.ui_before.p)
-                        zf.writestr(f"ui/{i * 2}.xml", step.ui_before.x)
+                        zf.writestr(f"ui/{i * 2}.xml", step.ui_before.x, **deflated)
                         zf.writestr(f"ui/{i * 2 + 1}.png", step.ui_after.p)
-                        zf.writestr(f"ui/{i * 2 + 1}.xml", step.ui_after.x)
+                        zf.writestr(f"ui/{i * 2 + 1}.xml", step.ui_after.x, **deflated)
 
                 content = "\n".join([step.event.to_json() for step in self.result])
-                zf.writestr("record.txt", content)
+                zf.writestr("record.txt", content, **deflated)
                 if self.pretest is not None:
-                    zf.writestr("pretest.py", self.pretest)
+                    zf.writestr("pretest.py", self.pretest, **deflated)
 
-                zf.writestr("gsrb.debug.log", log_in_memory.getvalue())
+                zf.writestr("gsrb.debug.log", log_in_memory.getvalue(), **deflated)
 
     def __generate(self) -> str:
         """根据当前修复配置的生成模板，生成对应目标代码"""
         if self.template == "u2":
             template = TEMPLATE_U2
-            lines = []
+            # 缩进直接拼在每行前，最后只 join 一次
+            lines: list[str] = []
             for step in self.result:
-                lines.append(step.event.generate_u2("d"))
-                if step in self.result_assertion:
-                    lines.append(self.result_assertion[step].event.generate_u2("d"))
-            content = "\n".join(f"    {line}" for line in lines)
+                lines.append(f"    {step.event.generate_u2('d')}")
+                if (assertion := self.result_assertion.get(step)) is not None:
+                    lines.append(f"    {assertion.event.generate_u2('d')}")
+            content = "\n".join(lines)
             device_name = "d"
             device_serial = ""
             package = self.package
@@ -294,11 +343,7 @@ class Repair:
         )
         children.sort(key=candidate_key)
 
-        candidates: list[Event] = []
-        for child in children:
-            locator = Locator.from_node(child)
-            event = Event(Action.CLICK, locator)
-            candidates.append(event)
+        candidates = [Event(Action.CLICK, Locator.from_node(c)) for c in children]
 
         for candidate in candidates:
             logger.info(f"explore candidate: {candidate}")
@@ -318,11 +363,16 @@ class Repair:
         original: list[Step] = self.result.copy()
 
         layout_before = self.__capture()
-        if not event.perform(self.device):
+        if not self.__perform(event):
             logger.error(f"perform new step failed: {event}")
             return False
 
-        layout_after = self.__capture()
+        # 剪枝，布局文本未变化时不再截屏与解析布局，直接返回
+        xml = self.device.dump_hierarchy()
+        if self.optimize_explore and xml == layout_before.xml:
+            logger.info("UI not change after exploration, return")
+            return False
+        layout_after = self.__layout = Layout(xml, screencap(self.device))
 
         self.result.append(
             Step(
@@ -333,7 +383,7 @@ class Repair:
         )
 
         # 剪枝，如果执行后界面无变更则提前返回
-        if self.optimize_explore and tree_equal(layout_before.root, layout_after.root):
+        if self.optimize_explore and layout_before.tree_hash == layout_after.tree_hash:
             logger.info("UI not change after exploration, return")
             self.result = original
             return False
@@ -362,10 +412,10 @@ class Repair:
             if not next_step
             else self.testcase[self.current + 1]
         )
-        current_event = deepcopy(current_step.event)
+        current_event = current_step.event
         if current_event.is_assertion():
             layout_before = self.__capture()
-            if current_event.perform(self.device):
+            if self.__perform(current_event):
                 # 断言成功
                 self.result.append(
                     Step(
@@ -419,7 +469,7 @@ class Repair:
             bool: 是否执行成功
         """
         layout_before = self.__capture()
-        if step.event.perform(self.device):
+        if self.__perform(step.event):
             layout_after = self.__capture()
             self.result.append(
                 Step(
@@ -468,10 +518,10 @@ class Repair:
             new_event = replace(step.event, locator=locator)
             logger.info(f"repair current step :{new_event}")
 
-            if new_event.perform(self.device):
+            if self.__perform(new_event):
                 layout_after = self.__capture()
 
-                if tree_equal(layout_before.root, layout_after.root):
+                if layout_before.tree_hash == layout_after.tree_hash:
                     # 点击前后 ui 无变化，认为该步不产生影响，跳过
                     logger.info("Succeed, UI not change after repair, skip")
                     self.current += offset
@@ -3,11 +3,11 @@ from dataclasses import dataclass, field
 from enum import Enum, auto
 from typing import Callable
 
-from uiautomator2 import Device, connect
+from uiautomator2 import Device
 
 from gsrb.common.step import Step, TestCase, Ui
 from gsrb.match.layout import Layout
-from gsrb.utils.app import get_version, init_app
+from gsrb.utils.app import get_device, get_version, init_app
 
 logger = logging.getLogger(__name__)
 
@@ -49,7 +49,7 @@ class RepairSession:
 
     def __post_init__(self) -> None:
         # init device
-        self.device = connect(self.device_serial)
+        self.device = get_device(self.device_serial)
         self.device.implicitly_wait(3.0)
 
         logger.info(f"init device {self.device_serial}")
@@ -1,21 +1,37 @@
 import logging
 import re
 import subprocess
-import time
+from functools import lru_cache
+from types import CodeType
 
-from uiautomator2 import Device, ShellResponse
+from uiautomator2 import Device, ShellResponse, connect
+
+from gsrb.common.event import wait_for_stable
 
 logger = logging.getLogger(__name__)
 
-permission_pattern = r"^\s*?(?P<permission>android\.permission\.[A-Za-z_]+?):\s*?granted=(?P<granted>false|true).*?$"  # noqa
+permission_pattern = re.compile(
+    r"^\s*?(?P<permission>android\.permission\.[A-Za-z_]+?):\s*?granted=(?P<granted>false|true).*?$",  # noqa
+    re.MULTILINE,
+)
+
+permission_cache: dict[tuple[str, str], list[str]] = {}
+"""按 (设备序列号, 包名) 缓存的权限列表"""
 
 wait_time = 5
+"""启动应用后等待界面稳定的最长时间"""
+launch_poll_interval = 0.5
+"""启动应用后判断界面是否稳定时获取布局的间隔"""
 
 
+@lru_cache(maxsize=None)
 def get_version(device: str, package: str) -> str | None:
     """根据 app 包名获取版本号
 
+    结果按 (device, package) 缓存，需要重新查询时调用 `get_version.cache_clear()`
+
     Args:
+        device (str): 设备序列号
         package (str): 包名
 
     Returns:
@@ -27,12 +43,55 @@ def get_version(device: str, package: str) -> str | None:
     )
     if result.returncode != 0:
         return None
-    for line in result.stdout.decode("utf-8").split("\n"):
-        if line.strip().startswith("versionName"):
-            return line.split("=")[1].strip()
+    # dumpsys 输出较长，只解码需要的那一行
+    for line in result.stdout.splitlines():
+        if line.strip().startswith(b"versionName"):
+            return line.split(b"=")[1].strip().decode("utf-8")
     return None
 
 
+@lru_cache(maxsize=None)
+def get_device(device: str) -> Device:
+    """连接设备
+
+    同一进程内按设备序列号复用连接，避免重复建立 adb 连接与启动 uiautomator2
+
+    Args:
+        device (str): 设备序列号
+
+    Returns:
+        Device: u2 device
+    """
+    return connect(device)
+
+
+def screencap(device: Device) -> bytes:
+    """获取 png 格式的截屏
+
+    通过 adb exec-out 直接读取 screencap 的输出，不经过设备上的临时文件，失败时退回 u2 截屏
+
+    Args:
+        device (Device): u2 device
+
+    Returns:
+        bytes: 截屏数据
+    """
+    try:
+        result = subprocess.run(
+            ["adb", "-s", device.serial, "exec-out", "screencap", "-p"],
+            capture_output=True,
+        )
+        if result.returncode == 0 and len(result.stdout) > 0:
+            return result.stdout
+    except OSError:
+        # 主机上没有 adb
+        pass
+    logger.debug(f"screencap on {device.serial} failed, fallback to u2 screenshot")
+    png = device.screenshot(format="raw")
+    assert isinstance(png, bytes)
+    return png
+
+
 def get_label(apk: str) -> str | None:
     result = subprocess.run(["aapt", "dump", "badging", apk], capture_output=True)
     if result.returncode != 0:
@@ -43,28 +102,33 @@ def get_label(apk: str) -> str | None:
     return None
 
 
-def get_permission_list(device: Device, package: str) -> list[str]:
+def get_permission_list(
+    device: Device, package: str, refresh: bool = False
+) -> list[str]:
     """获取当前包的权限列表
 
+    结果按 (设备序列号, 包名) 缓存，重新安装应用后需传入 refresh=True 重新查询
+
     Args:
         device (Device): u2 device
         package (str): 包名
+        refresh (bool, optional): 是否忽略缓存重新查询. Defaults to False.
 
     Returns:
         list[str]: 需求的权限列表
     """
+    key = (device.serial, package)
+    if not refresh and key in permission_cache:
+        return permission_cache[key]
     result: list[str] = []
     info = device.shell(["dumpsys", "package", package])
     assert isinstance(info, ShellResponse)
     output: str = info.output
-    for line in output.split("\n"):
-        if match := re.match(
-            permission_pattern,
-            line,
-        ):
-            permission: str = match.group("permission")
-            logger.debug(f"{package}: {permission}")
-            result.append(permission)
+    for match in permission_pattern.finditer(output):
+        permission: str = match.group("permission")
+        logger.debug(f"{package}: {permission}")
+        result.append(permission)
+    permission_cache[key] = result
     return result
 
 
@@ -76,9 +140,28 @@ def grant_permission(device: Device, package: str) -> None:
         package (str): 包名
     """
     logger.debug(f"grant permissons for {package}")
-    for permission in get_permission_list(device, package):
-        device.shell(["pm", "grant", package, permission])
-        logger.debug(f"execute: pm grant {package} {permission}")
+    commands = [f"pm grant {package} {p}" for p in get_permission_list(device, package)]
+    if len(commands) == 0:
+        return
+    # 合并为一次 shell 调用，单条授权失败不影响后续命令
+    device.shell("; ".join(commands))
+    for command in commands:
+        logger.debug(f"execute: {command}")
+
+
+@lru_cache(maxsize=None)
+def compile_pretest(pretest: str) -> CodeType:
+    """编译 pretest 脚本
+
+    恢复应用时会反复执行同一个 pretest，按脚本内容缓存编译结果
+
+    Args:
+        pretest (str): pretest 脚本内容
+
+    Returns:
+        CodeType: 编译后的代码对象
+    """
+    return compile(pretest, "<pretest>", "exec")
 
 
 def init_app(device: Device, package: str, pretest: str | None = None) -> None:
@@ -109,6 +192,7 @@ def init_app(device: Device, package: str, pretest: str | None = None) -> None:
         print(pretest)
         g = globals()
         g["__name__"] = "__main__"
-        exec(pretest, g)
+        exec(compile_pretest(pretest), g)
 
-    time.sleep(wait_time)
+    # 启动阶段界面变化较慢，使用较长的间隔判断界面是否稳定
+    wait_for_stable(device, timeout=wait_time, interval=launch_poll_interval)
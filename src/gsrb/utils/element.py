@@ -2,9 +2,12 @@ import io
 import json
 import logging
 import re
+from collections.abc import Sequence
+from functools import lru_cache
 from typing import NamedTuple
 from xml.etree.ElementTree import Element, fromstring
 
+import numpy as np
 from PIL import Image, ImageDraw
 
 from gsrb.common.locator import Locator
@@ -12,6 +15,7 @@ from gsrb.common.locator import Locator
 bound_pattern = (
     r"^\s*\[(?P<x0>\d+)\s*,\s*(?P<y0>\d+)]\[(?P<x1>\d+)\s*,\s*(?P<y1>\d+)]\s*$"  # noqa
 )
+bound_regex = re.compile(bound_pattern)
 
 logger = logging.getLogger(__name__)
 
@@ -46,7 +50,26 @@ def coordinates(node: Element | str) -> Coordinate:
         bounds = node.get("bounds", "[0,0][0,0]")
     else:
         bounds = node
-    if match := re.match(bound_pattern, bounds):
+    return parse_bounds(bounds)
+
+
+@lru_cache(maxsize=8192)
+def parse_bounds(bounds: str) -> Coordinate:
+    """解析 bounds 字符串，几何判断中同一节点会被反复解析，结果按字符串缓存
+
+    Args:
+        bounds (str): bounds 属性
+
+    Returns:
+        Coordinate: 左上角和右下角的坐标，解析失败时为 0, 0, 0, 0
+    """
+    # uiautomator 导出的 bounds 均为 [x0,y0][x1,y1] 的形式，直接切分，其余情况使用正则
+    if bounds.startswith("[") and bounds.endswith("]"):
+        left, sep, right = bounds[1:-1].partition("][")
+        parts = left.split(",") + right.split(",")
+        if sep and len(parts) == 4 and all(p.isascii() and p.isdigit() for p in parts):
+            return Coordinate(*map(int, parts))
+    if match := bound_regex.match(bounds):
         return Coordinate(
             int(match.group("x0")),
             int(match.group("y0")),
@@ -56,33 +79,76 @@ def coordinates(node: Element | str) -> Coordinate:
     return Coordinate()
 
 
+def bounds_array(nodes: Sequence[Element]) -> np.ndarray:
+    """一次性解析一组节点的 bounds 属性
+
+    >>> from xml.etree.ElementTree import fromstring
+    >>> a = fromstring("<node bounds='[189,1174][404,1231]' />")
+    >>> b = fromstring("<node />")
+    >>> bounds_array([a, b]).tolist()
+    [[189, 1174, 404, 1231], [0, 0, 0, 0]]
+
+    Args:
+        nodes (Sequence[Element]): 节点序列
+
+    Returns:
+        np.ndarray: 形状为 (N, 4) 的 int32 数组，每行依次为 x0 y0 x1 y1
+    """
+    if len(nodes) == 0:
+        return np.zeros((0, 4), dtype=np.int32)
+    # 先收集为元组列表再一次性转换，避免逐行写入数组
+    return np.array([parse_bounds(n.get("bounds", "")) for n in nodes], dtype=np.int32)
+
+
+quote = json.encoder.encode_basestring_ascii
+"""json 使用的字符串转义函数"""
+
+
 def digest(node: Element) -> str:
     """将结点的关键属性转换成可读的字符串
 
+    输出与 json.dumps 序列化对应字典的结果一致
+
+    >>> from xml.etree.ElementTree import fromstring
+    >>> digest(fromstring("<node class='a' text='b' bounds='[0,0][1,1]' />"))
+    '{"c": "a", "t": "b", "d": "", "r": "", "b": "[0,0][1,1]"}'
+
     Args:
         node (Element): 节点
 
     Returns:
         str: 节点信息
     """
-    result = dict()
-    for name, attr in [
-        ("c", "class"),
-        ("t", "text"),
-        ("d", "content-desc"),
-        ("r", "resource-id"),
-        ("b", "bounds"),
-    ]:
-        result[name] = node.get(attr, "")
-    return json.dumps(result)
-
-
-def draw_element(screen: bytes, layout: str, locator: Locator | None) -> bytes:
+    get = node.attrib.get
+    return (
+        f'{{"c": {quote(get("class", ""))}, '
+        f'"t": {quote(get("text", ""))}, '
+        f'"d": {quote(get("content-desc", ""))}, '
+        f'"r": {quote(get("resource-id", ""))}, '
+        f'"b": {quote(get("bounds", ""))}}}'
+    )
+
+
+def draw_element(
+    screen: bytes, layout: str | Element, locator: Locator | None
+) -> bytes:
+    """在截屏上框出定位符对应的控件
+
+    找不到控件时直接返回原截屏，不解码图片
+
+    Args:
+        screen (bytes): png 格式的截屏
+        layout (str | Element): 布局或已解析的布局树根节点
+        locator (Locator | None): 定位符
+
+    Returns:
+        bytes: 绘制后的截屏
+    """
     if locator is None:
         return screen
-    root = fromstring(layout)
+    root = fromstring(layout) if isinstance(layout, str) else layout
     if (element := locator.find_in_layout(root)) is None:
-        logger.warning(f"cannot find {layout} in root, return unchanged image")
+        logger.warning(f"cannot find {locator} in layout, return unchanged image")
         return screen
     with io.BytesIO(screen) as f, Image.open(f) as img:
         draw = ImageDraw.Draw(img)
@@ -90,6 +156,7 @@ def draw_element(screen: bytes, layout: str, locator: Locator | None) -> bytes:
         coord = coordinates(element)
         draw.rectangle(coord, width=5, outline="#FF0000")
 
+        # 仅用于展示，使用最快的压缩等级
         bio = io.BytesIO()
-        img.save(bio, format="png")
+        img.save(bio, format="png", compress_level=1)
         return bio.getvalue()
@@ -1,29 +1,112 @@
-import io
 import logging
+import os
 import sys
+import threading
+import time
+from collections import deque
 from functools import wraps
+from logging.handlers import MemoryHandler
 from typing import Callable, Generic, ParamSpec, TypeVar
 
 P = ParamSpec("P")
 T = TypeVar("T")
 
-log_in_memory = io.StringIO()
+buffer_capacity = 1024
+"""日志文件缓冲的记录条数，缓冲满或出现 ERROR 时写入文件"""
+
+flush_interval = 1.0
+"""日志文件缓冲的最长时间，单位为秒，超过后由后台线程写入文件"""
+
+memory_log_limit = 100_000
+"""内存中保留的日志条数上限"""
+
+
+class MemoryLog(logging.Handler):
+    """在内存中保留最近若干条日志的 handler
+
+    用于将调试日志一并写入录制或修复的输出，超出上限时丢弃最早的记录
+    """
+
+    def __init__(self, limit: int) -> None:
+        super().__init__()
+        self.lines: deque[str] = deque(maxlen=limit)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.lines.append(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def getvalue(self) -> str:
+        """获取保留的全部日志"""
+        return "".join(f"{line}\n" for line in self.lines)
+
+    def clear(self) -> None:
+        """清空保留的日志，在同一进程开始新的录制或修复前调用"""
+        self.lines.clear()
+
+
+log_in_memory = MemoryLog(memory_log_limit)
+
+
+class BufferedHandler(MemoryHandler):
+    """按条数和时间批量写入目标 handler
+
+    除了缓冲满或出现 ERROR 时写入，后台线程每隔 interval 秒写入一次，空闲时日志也不会长时间停留在内存中
+
+    fork 出的子进程中没有后台线程，距上次写入超过 interval 秒时在下一条记录到来时写入
+    """
+
+    def __init__(
+        self, capacity: int, interval: float, flushLevel: int, target: logging.Handler
+    ) -> None:
+        super().__init__(capacity, flushLevel=flushLevel, target=target)
+        self.interval = interval
+        self.last_flush = time.monotonic()
+        self.stopped = threading.Event()
+        self.flusher = threading.Thread(target=self.__flush_periodically, daemon=True)
+        self.flusher.start()
+
+    def __flush_periodically(self) -> None:
+        while not self.stopped.wait(self.interval):
+            self.flush()
+
+    def shouldFlush(self, record: logging.LogRecord) -> bool:
+        return (
+            super().shouldFlush(record)
+            or time.monotonic() - self.last_flush >= self.interval
+        )
+
+    def flush(self) -> None:
+        super().flush()
+        self.last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.stopped.set()
+        super().close()
 
 
 class ExecuteOnce(Generic[T]):
+    """只执行一次被装饰的函数，之后的调用直接返回第一次的结果
+
+    多个线程同时首次调用时，只有一个线程执行函数，其余线程等待其完成
+    """
+
     def __init__(self) -> None:
         self.executed = False
         self.result: T | None = None
+        self.lock = threading.Lock()
 
     def __call__(self, func: Callable[P, T | None]) -> Callable[P, T | None]:
         @wraps(func)
         def wrapper(*args: P.args, **kwargs: P.kwargs) -> T | None:
-            if not self.executed:
-                self.executed = True
-                self.result = func(*args, **kwargs)
-                return self.result
-            else:
+            if self.executed:
                 return self.result
+            with self.lock:
+                if not self.executed:
+                    self.result = func(*args, **kwargs)
+                    self.executed = True
+            return self.result
 
         return wrapper
 
@@ -37,6 +120,7 @@ def config_logger() -> None:
         "%(name)-30s %(lineno)-4d %(levelname)-8s %(message)s"
     )
 
+    # 在主进程中立即打开文件，fork 出的工作进程共享同一个文件而不会再次截断
     file_handler = logging.FileHandler("gsrb.log", mode="w", encoding="utf-8")
     file_handler.setLevel(logging.INFO)
     file_handler.setFormatter(formatter)
@@ -49,12 +133,27 @@ def config_logger() -> None:
     std_handler.setLevel(logging.INFO)
     std_handler.setFormatter(formatter)
 
-    memory_handler = logging.StreamHandler(log_in_memory)
-    memory_handler.setLevel(logging.DEBUG)
-    memory_handler.setFormatter(formatter)
+    log_in_memory.setLevel(logging.DEBUG)
+    log_in_memory.setFormatter(formatter)
 
     logger.setLevel(logging.DEBUG)
-    logger.addHandler(file_handler)
-    logger.addHandler(debug_handler)
+    # 文件 handler 每条记录都会写入并 flush，先在内存中缓冲再批量写入
+    for handler in (file_handler, debug_handler):
+        buffered = BufferedHandler(
+            buffer_capacity, flush_interval, flushLevel=logging.ERROR, target=handler
+        )
+        buffered.setLevel(handler.level)
+        logger.addHandler(buffered)
     logger.addHandler(std_handler)
-    logger.addHandler(memory_handler)
+    logger.addHandler(log_in_memory)
+    # fork 前清空缓冲，避免子进程继承后重复写入
+    os.register_at_fork(before=flush_logger)
+
+
+def flush_logger() -> None:
+    """将缓冲的日志写入文件
+
+    进程正常退出时会自动写入，不经过 atexit 退出的进程（如进程池的工作进程）需要手动调用
+    """
+    for handler in logging.getLogger("gsrb").handlers:
+        handler.flush()
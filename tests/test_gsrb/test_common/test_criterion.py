@@ -74,7 +74,5 @@ def test_from_dict(
     d: dict[str, str | bool | int], result: dict[Criterion, str]
 ) -> None:
     assert {
-        Criterion.from_parameter(k): v
-        for k, v in d.items()
-        if Criterion.from_parameter(k) is not None
+        c: v for k, v in d.items() if (c := Criterion.from_parameter(k)) is not None
     } == result
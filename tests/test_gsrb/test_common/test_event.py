@@ -22,6 +22,15 @@ def test_perform(mocker: MockerFixture) -> None:
 
     mock_object.__setattr__("click", mock_click)
     mock_device.return_value = [mock_object]
+    mock_device.__setattr__("dump_hierarchy", mocker.stub("mock_dump"))
     event.perform(mock_device)
     mock_click.assert_called_once()
     mock_device.assert_called_once_with(text="Documents")
+
+
+def test_generate_u2() -> None:
+    locator = Locator({Criterion.TEXT: "Documents"}, 0)
+    event = Event(Action.CLICK, locator, {"repaired": True})
+    assert event.generate_u2("d") == "d(text='Documents').click()  # repaired"
+    event = Event(Action.EXIST, locator, {"failed": True})
+    assert event.generate_u2("d") == "# assert d(text='Documents').exists"
@@ -25,3 +25,23 @@ def test_convert() -> None:
 def test_exception() -> None:
     locator = Locator.from_json('{"criteria": {"TEXT": "Documents", "NAME": "bla"}}')
     assert locator.to_dict() == {"criteria": {"TEXT": "Documents"}}
+
+
+def test_find_multiple_criteria() -> None:
+    tree = Element("hierarchy")
+    SubElement(tree, "node", {"text": "a", "class": "x"})
+    first = SubElement(tree, "node", {"text": "a", "class": "y"})
+    second = SubElement(tree, "node", {"text": "a", "class": "y"})
+    locator = Locator({Criterion.TEXT: "a", Criterion.CLASS: "y"})
+    assert locator.find_in_layout(tree) is first
+    assert Locator(locator.criteria, 1).find_in_layout(tree) is second
+    assert Locator(locator.criteria, 2).find_in_layout(tree) is None
+
+
+def test_from_node() -> None:
+    a = Element("node", {"text": "a", "text-index": "1", "class": "x"})
+    b = Element("node", {"text": "a", "text-index": "1", "class": "y"})
+    c = Element("node", {"text": "", "class": "x", "class-index": "2"})
+    assert Locator.from_node(a) == Locator({Criterion.TEXT: "a"}, 1)
+    assert Locator.from_node(a) is Locator.from_node(b)
+    assert Locator.from_node(c) == Locator({Criterion.CLASS: "x"}, 2)
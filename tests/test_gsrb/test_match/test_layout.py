@@ -0,0 +1,40 @@
+from xml.etree.ElementTree import Element, fromstring
+
+from gsrb.match.layout import Layout, compress_parents, get_non_unique, get_valid_node
+from gsrb.match.preprocess import preprocess
+
+xml = """<hierarchy>
+<node class="android.widget.FrameLayout" resource-id="android:id/content" bounds="[0,0][1080,1920]">
+<node class="android.widget.TextView" text="covered" clickable="true" bounds="[0,0][500,200]" />
+<node class="android.widget.Button" text="cover" clickable="true" bounds="[0,0][1080,400]" />
+<node class="android.widget.TextView" text="label" clickable="false" bounds="[100,100][300,150]" />
+<node class="android.widget.TextView" text="other" clickable="false" bounds="[0,1000][500,1200]" />
+</node>
+</hierarchy>"""  # noqa
+
+
+def test_get_valid_node() -> None:
+    root = fromstring(xml)
+    preprocess(root)
+    nodes = list(root.iter("node"))
+    texts = {n.get("text") for n in get_valid_node(nodes)}
+    assert texts == {None, "cover", "other"}
+
+
+def test_compress_parents() -> None:
+    root = fromstring("<node><node><node /><node /></node></node>")
+    outer, inner = root, root[0]
+    assert compress_parents({outer, inner}) == {inner}
+
+
+def test_get_non_unique() -> None:
+    a = Element("node", {"resource-id": "id/item", "text": "a"})
+    b = Element("node", {"resource-id": "id/item", "text": "a"})
+    c = Element("node", {"resource-id": "id/item", "text": "c"})
+    assert get_non_unique([a, b, c]) == {a, b}
+
+
+def test_layout_attrs() -> None:
+    layout = Layout(xml, bytes())
+    assert list(layout.attrs["text"]) == [n.get("text", "") for n in layout.nodes]
+    assert not layout.excluded.any()
@@ -0,0 +1,32 @@
+import io
+
+import pytest
+from PIL import Image
+
+from gsrb.match.layout import Layout
+from gsrb.match.match import decode_gray, match_layout
+
+xml = """<hierarchy>
+<node class="android.widget.FrameLayout" resource-id="android:id/content" bounds="[0,0][1080,1920]">
+<node class="android.widget.Button" text="ok" clickable="true" bounds="[0,0][1080,400]" />
+<node class="android.widget.TextView" text="label" bounds="[0,1000][500,1200]" />
+</node>
+</hierarchy>"""  # noqa
+
+
+def blank_png() -> bytes:
+    with io.BytesIO() as f:
+        Image.new("RGB", (1080, 1920), (255, 255, 255)).save(f, "png")
+        return f.getvalue()
+
+
+def test_match_blank_screenshots() -> None:
+    png = blank_png()
+    result = match_layout(Layout(xml, png), Layout(xml, png))
+    assert result.is_match
+    assert len(result.matched) == 2
+
+
+def test_decode_corrupt_screenshot() -> None:
+    with pytest.raises(ValueError):
+        decode_gray(b"not a png")
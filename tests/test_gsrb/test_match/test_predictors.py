@@ -1,8 +1,10 @@
 from xml.etree.ElementTree import Element
 
+import numpy as np
 import pytest
 
-from gsrb.match.predictors import attr_equal, attr_like
+from gsrb.match.predictors import attr_equal, attr_like, is_overlap, overlaps
+from gsrb.utils.element import coordinates
 
 node1 = Element("node", {"resource-id": "android:id/id1", "text": "text1"})
 node2 = Element("node", {"resource-id": "android:id/id1", "text": "text2"})
@@ -23,3 +25,22 @@ def test_attr_equal(a: Element, b: Element, attr: str, result: bool) -> None:
 )
 def test_attr_like(a: Element, b: Element, attr: str, result: bool) -> None:
     assert attr_like(a, b, attr) == result
+
+
+@pytest.mark.parametrize(
+    ["a", "b", "result"],
+    [
+        ("[100,100][300,300]", "[200,200][400,400]", True),
+        ("[100,100][300,300]", "[0,0][500,500]", True),
+        ("[100,100][300,300]", "[400,100][500,300]", False),
+        ("[100,100][300,300]", "[0,100][50,300]", False),
+        ("[100,100][300,300]", "[300,100][400,300]", False),
+    ],
+)
+def test_is_overlap(a: str, b: str, result: bool) -> None:
+    node_a = Element("node", {"bounds": a})
+    node_b = Element("node", {"bounds": b})
+    assert is_overlap(node_a, node_b) == result
+    assert is_overlap(node_b, node_a) == result
+    boxes = np.array([coordinates(b)])
+    assert overlaps(np.array(coordinates(a)), boxes).tolist() == [result]